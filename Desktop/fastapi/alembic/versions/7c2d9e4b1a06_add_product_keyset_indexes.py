@@ -0,0 +1,31 @@
+"""add product keyset pagination indexes
+
+Revision ID: 7c2d9e4b1a06
+Revises: 43e1db201b61
+Create Date: 2026-01-12 10:14:03.512447
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2d9e4b1a06'
+down_revision: Union[str, Sequence[str], None] = '43e1db201b61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_product_name_id', 'product', ['name', 'id'], unique=False)
+    op.create_index('ix_product_price_id', 'product', ['price', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_product_price_id', table_name='product')
+    op.drop_index('ix_product_name_id', table_name='product')
@@ -0,0 +1,43 @@
+"""add product embedding table
+
+Revision ID: a6e2d4b8f157
+Revises: f19c5a8d2e73
+Create Date: 2026-02-17 15:33:12.470981
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+from pgvector.sqlalchemy import Vector
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6e2d4b8f157'
+down_revision: Union[str, Sequence[str], None] = 'f19c5a8d2e73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    is_postgres = op.get_bind().dialect.name == 'postgresql'
+    if is_postgres:
+        op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    op.create_table('product_embedding',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('embedding', Vector(256), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+    sa.PrimaryKeyConstraint('product_id')
+    )
+    if is_postgres:
+        op.create_index('ix_product_embedding_hnsw', 'product_embedding', ['embedding'], unique=False,
+                        postgresql_using='hnsw', postgresql_ops={'embedding': 'vector_cosine_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_product_embedding_hnsw', table_name='product_embedding')
+    op.drop_table('product_embedding')
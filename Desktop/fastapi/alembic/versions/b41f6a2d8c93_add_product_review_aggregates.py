@@ -0,0 +1,36 @@
+"""add product review aggregates
+
+Revision ID: b41f6a2d8c93
+Revises: 7c2d9e4b1a06
+Create Date: 2026-01-19 16:42:27.081934
+
+Existing rows start at zero; run tasks.backfill_review_aggregates afterwards
+to populate them from the review table.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41f6a2d8c93'
+down_revision: Union[str, Sequence[str], None] = '7c2d9e4b1a06'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+AGGREGATE_COLUMNS = ['review_count', 'rating_sum', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for column in AGGREGATE_COLUMNS:
+        op.add_column('product', sa.Column(column, sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for column in reversed(AGGREGATE_COLUMNS):
+        op.drop_column('product', column)
@@ -0,0 +1,29 @@
+"""add user token version
+
+Revision ID: c7d4e2a9b315
+Revises: a6e2d4b8f157
+Create Date: 2026-03-02 11:08:41.215736
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d4e2a9b315'
+down_revision: Union[str, Sequence[str], None] = 'a6e2d4b8f157'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('user', 'token_version')
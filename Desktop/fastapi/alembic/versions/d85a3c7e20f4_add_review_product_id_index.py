@@ -0,0 +1,29 @@
+"""add review (product_id, id) index
+
+Revision ID: d85a3c7e20f4
+Revises: b41f6a2d8c93
+Create Date: 2026-01-26 11:05:48.330216
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd85a3c7e20f4'
+down_revision: Union[str, Sequence[str], None] = 'b41f6a2d8c93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_review_product_id_id', 'review', ['product_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_review_product_id_id', table_name='review')
@@ -0,0 +1,68 @@
+"""add product search index
+
+Revision ID: e3b7c1f94a58
+Revises: d85a3c7e20f4
+Create Date: 2026-02-03 14:27:51.904116
+
+Postgres: a generated tsvector column over name + description with a GIN
+index, and a pg_trgm GIN index on name for fuzzy matches.
+SQLite (local/testing): an external-content FTS5 table kept in sync by triggers.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b7c1f94a58'
+down_revision: Union[str, Sequence[str], None] = 'd85a3c7e20f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(
+            "ALTER TABLE product ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, ''))) STORED"
+        )
+        op.create_index('ix_product_search_vector', 'product', ['search_vector'], unique=False, postgresql_using='gin')
+        op.create_index('ix_product_name_trgm', 'product', ['name'], unique=False, postgresql_using='gin',
+                        postgresql_ops={'name': 'gin_trgm_ops'})
+    elif dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE product_fts USING fts5(name, description, content='product', content_rowid='id')"
+        )
+        op.execute(
+            "CREATE TRIGGER product_fts_ai AFTER INSERT ON product BEGIN "
+            "INSERT INTO product_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER product_fts_ad AFTER DELETE ON product BEGIN "
+            "INSERT INTO product_fts(product_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER product_fts_au AFTER UPDATE OF name, description ON product BEGIN "
+            "INSERT INTO product_fts(product_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); "
+            "INSERT INTO product_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END"
+        )
+        op.execute("INSERT INTO product_fts(product_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.drop_index('ix_product_name_trgm', table_name='product')
+        op.drop_index('ix_product_search_vector', table_name='product')
+        op.drop_column('product', 'search_vector')
+    elif dialect == 'sqlite':
+        for trigger in ('product_fts_au', 'product_fts_ad', 'product_fts_ai'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS product_fts")
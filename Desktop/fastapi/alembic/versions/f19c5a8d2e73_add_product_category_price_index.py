@@ -0,0 +1,29 @@
+"""add product (category_id, price) index
+
+Revision ID: f19c5a8d2e73
+Revises: e3b7c1f94a58
+Create Date: 2026-02-10 09:51:36.627410
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f19c5a8d2e73'
+down_revision: Union[str, Sequence[str], None] = 'e3b7c1f94a58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_product_category_id_price', 'product', ['category_id', 'price'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_product_category_id_price', table_name='product')
@@ -1,11 +1,10 @@
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlmodel.ext.asyncio.session import AsyncSession
-from core.db import get_session
+from core.db import get_read_session, get_session
 from crud import crud_category
 from schema import CategoryCreate, CategoryPublic
-from fastapi_cache.decorator import cache
-from fastapi_cache import FastAPICache
+from core.cache import cache_tagged, invalidate_stale
 
 router = APIRouter()
 
@@ -15,14 +14,16 @@ async def create_category(
     session: AsyncSession = Depends(get_session)
 ):
     new_category = await crud_category.create_category(category_data=category_data, session=session)
-    await FastAPICache.clear(namespace="get_allcategory_list")
+    await session.commit()
+    await invalidate_stale(session)
     return new_category
 
 
 @router.get("/", response_model=List[CategoryPublic])
-@cache(expire=300, namespace="get_allcategory_list")
+@cache_tagged(expire=3600, namespace="get_allcategory_list", tags=["categories"], prerender=True,
+              distributed=True)
 async def get_all_category(
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_read_session)
 ):
     return await crud_category.get_all_category(session=session)
 
@@ -30,7 +31,7 @@ async def get_all_category(
 @router.get("/{category_id}", response_model=CategoryPublic)
 async def get_category_by_id(
     category_id: int,
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_read_session)
 ):
     result = await crud_category.get_category_by_id(category_id=category_id, session=session)
     if not result:
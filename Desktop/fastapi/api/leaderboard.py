@@ -0,0 +1,41 @@
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, Query, status
+from sqlmodel.ext.asyncio.session import AsyncSession
+import redis.asyncio as redis
+from core.auth import is_admin
+from core.db import get_session
+from core.redis_client import get_redis
+from core.singleflight import single_flight
+from crud import crud_leaderboard, crud_product
+from schema import LeaderboardEntry
+from tasks import rebuild_leaderboards
+
+router = APIRouter()
+
+@router.get("/{board}", response_model=List[LeaderboardEntry])
+@single_flight
+async def get_leaderboard(
+    board: Literal["top_rated", "most_reviewed"],
+    category_id: Optional[int] = Query(None, description="Rank only the products of this category."),
+    limit: int = Query(10, ge=1, le=100),
+    session: AsyncSession = Depends(get_session),
+    redis_client: redis.Redis = Depends(get_redis)
+):
+    """
+    Get the best rated or most reviewed products, overall or in one category.
+    """
+    entries = await crud_leaderboard.get_leaderboard(redis_client, board, category_id=category_id, limit=limit)
+    products = await crud_product.get_products_by_ids([product_id for product_id, _ in entries], session=session)
+    ranked = [(product_id, score) for product_id, score in entries if product_id in products]
+    return [
+        LeaderboardEntry(rank=rank, score=score, product=products[product_id])
+        for rank, (product_id, score) in enumerate(ranked, start=1)
+    ]
+
+@router.post("/rebuild", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(is_admin())])
+async def rebuild_all_leaderboards():
+    """
+    Recompute every leaderboard from the database in the background.
+    """
+    task = rebuild_leaderboards.delay()
+    return {"task_id": task.id}
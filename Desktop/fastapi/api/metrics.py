@@ -0,0 +1,94 @@
+from fastapi import APIRouter, Depends, Request
+from fastapi_cache import FastAPICache
+from core.auth import is_admin, revocations, user_cache
+from core.cache import InstrumentedBackend, L1Backend
+from core.db import engine, replicas
+from core.db_pool import pool_stats
+from core.httpx_client import client_stats
+from core.security import hasher
+from core.singleflight import flights
+from core.sql_metrics import sql_metrics
+from external_services import weather
+
+router = APIRouter(dependencies=[Depends(is_admin())])
+
+@router.get("/cache")
+async def get_cache_metrics():
+    """
+    Per-namespace hit/miss counters and average lookup latency of the response cache
+    for this worker process, and the state of its in-process L1 (hits there are
+    also counted as hits in the namespaces).
+    """
+    backend = FastAPICache.get_backend()
+    if not isinstance(backend, InstrumentedBackend):
+        return {}
+    l1 = backend.backend if isinstance(backend.backend, L1Backend) else None
+    return {"namespaces": backend.snapshot(), "l1": l1.stats() if l1 else None}
+
+@router.get("/auth")
+async def get_auth_metrics():
+    """
+    Cache of users resolved from access tokens in this worker (hits served locally,
+    shared_hits from Redis, misses that queried the database), and its token
+    revocation filter (probable: filter hits checked in Redis, confirmed: revoked).
+    """
+    return {"users": user_cache.stats(), "revocations": revocations.stats()}
+
+@router.get("/password-hasher")
+async def get_password_hasher_metrics():
+    """
+    bcrypt pool of this worker: hashes running and queued, rejected when the queue
+    was full, and average time spent waiting for a thread and hashing.
+    """
+    return hasher.stats()
+
+@router.get("/sql")
+async def get_sql_metrics():
+    """
+    Statements run by this worker: totals, per route averages with the most
+    queries one request needed and how many requests looked like an N+1, and
+    the slowest statements.
+    """
+    return sql_metrics.snapshot()
+
+@router.get("/db-pool")
+async def get_db_pool_metrics():
+    """
+    Database connection pool of this worker: connections checked out and idle,
+    overflow beyond the pool size, and how long checkouts waited (timeouts gave
+    up after DB_POOL_TIMEOUT). Size the pool per worker from these.
+    """
+    return pool_stats(engine.sync_engine)
+
+@router.get("/replicas")
+async def get_replica_metrics():
+    """
+    Read replicas of this worker: health, sessions handed out and pool of each,
+    and reads that went to the primary (sticky: within the read-your-writes
+    window after the client's own write; cache_fill: on routes whose responses
+    are cached for every client).
+    """
+    return replicas.stats()
+
+@router.get("/single-flight")
+async def get_single_flight_metrics():
+    """
+    Request coalescing in this worker: leaders ran the endpoint, followers shared
+    a leader's result, peer_waits waited for another worker to fill the cache.
+    """
+    return flights.stats()
+
+@router.get("/weather")
+async def get_weather_metrics():
+    """
+    State of the weather upstream circuit breaker and of background refreshes in this worker.
+    """
+    return {"breaker": weather.breaker.stats(), "refreshing": len(weather._refreshing)}
+
+@router.get("/http-client")
+async def get_http_client_metrics(request: Request):
+    """
+    Outgoing HTTP client of this worker: requests, errors, average time to response
+    headers, and the pool's active/idle connections.
+    """
+    return client_stats(request.app.state.httpx_client)
@@ -1,18 +1,42 @@
 # api/products.py
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import codecs
+import csv
+import io
+import json
+from typing import Any, AsyncIterator, List, Literal, Optional, Tuple, Union
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import sessionmaker
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from core.db import get_session
+from core.cache import cache_tagged, invalidate_stale
+from core.config import Settings, get_settings
+from core.db import get_read_session, get_session, replicas
 from crud import crud_product
-from schema import ProductCreate, ProductPublic
+from schema import BulkProductReport, BulkRowError, ProductCreate, ProductFacetedList, ProductPage, ProductPublic, ProductSummaryPage, SimilarProduct, UserPublic
 
 from typing import Annotated
 from core.auth import get_current_user, is_admin
-from model.models import User
+from model.models import Product
 
 router = APIRouter()
 
+ReviewsLimit = Annotated[int, Query(
+    ge=0, le=100,
+    description="How many of the newest reviews to embed per product; the rest are paged via reviews_next.")]
+
+def _listing_tags(category_id: Optional[int], facets: bool, **_) -> List[str]:
+    # A single-category listing only goes stale with that category; facets count every category
+    if category_id is not None and not facets:
+        return [f"category:{category_id}"]
+    return ["catalog"]
+
+def _with_reviews_next(products: List[Product], reviews_next: dict) -> List[ProductPublic]:
+    return [ProductPublic.model_validate(product, update={"reviews_next": reviews_next.get(product.id)})
+            for product in products]
+
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=ProductPublic, dependencies=[Depends(is_admin())])
 async def create_new_product(
     product_data: ProductCreate,
@@ -23,34 +47,293 @@ async def create_new_product(
     Create a new product.
     """
     new_product = await crud_product.create_product(product_data=product_data, session=session)
+    await session.commit()
+    await invalidate_stale(session)
     return new_product
 
-@router.get("/", response_model=List[ProductPublic])
-async def get_all_products_list(
+BULK_CHUNK_SIZE = 1000
+BULK_MAX_REPORTED_ERRORS = 1000
+
+async def _iter_lines(request: Request) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+async def _iter_text_lines(request: Request) -> AsyncIterator[str]:
+    # Lines keep their line break, which csv needs for quoted fields spanning lines
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    try:
+        async for chunk in request.stream():
+            buffer += decoder.decode(chunk)
+            *lines, buffer = buffer.split("\n")
+            for line in lines:
+                yield line + "\n"
+        buffer += decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The upload is not valid UTF-8.")
+    if buffer:
+        yield buffer
+
+async def _iter_csv_records(request: Request) -> AsyncIterator[List[str]]:
+    # A record ends at a line break outside quotes, i.e. once it holds an even
+    # number of quote characters ("" escapes one inside a quoted field)
+    record = ""
+    async for line in _iter_text_lines(request):
+        record += line
+        if record.count('"') % 2:
+            continue
+        for values in csv.reader(io.StringIO(record, newline="")):
+            yield values
+        record = ""
+    if record:
+        for values in csv.reader(io.StringIO(record, newline="")):
+            yield values
+
+async def _iter_bulk_rows(request: Request) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Yields (row number, raw row) from a JSON array, NDJSON or CSV body.
+    NDJSON and CSV are parsed record by record as the upload arrives.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type == "application/x-ndjson":
+        row = 0
+        async for line in _iter_lines(request):
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                yield row, json.loads(line)
+            except ValueError:
+                yield row, None
+    elif content_type == "text/csv":
+        header = None
+        row = 0
+        async for values in _iter_csv_records(request):
+            if not any(value.strip() for value in values):
+                continue
+            if header is None:
+                header = values
+                continue
+            row += 1
+            yield row, dict(zip(header, values))
+    else:
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        if not isinstance(body, list):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a JSON array of products.")
+        for row, item in enumerate(body, start=1):
+            yield row, item
+
+@router.post(
+    "/bulk",
+    response_model=BulkProductReport,
+    dependencies=[Depends(is_admin())],
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": {"type": "array", "items": ProductCreate.model_json_schema()}},
+        "application/x-ndjson": {"schema": {"type": "string"}},
+        "text/csv": {"schema": {"type": "string"}},
+    }}},
+)
+async def create_products_in_bulk(
+    request: Request,
     session: AsyncSession = Depends(get_session),
+):
+    """
+    Create many products from a JSON array, an NDJSON stream or a CSV upload
+    (header: name,description,price,category_id). Rows are validated and written
+    in batches; invalid rows are skipped and reported, valid rows are kept.
+    """
+    category_ids = await crud_product.get_category_ids(session=session)
+    inserted = 0
+    errors: List[BulkRowError] = []
+    failed = 0
+    batch: List[dict] = []
+    batch_rows: List[int] = []
+
+    def reject(row: int, messages: List[str]):
+        nonlocal failed
+        failed += 1
+        if len(errors) < BULK_MAX_REPORTED_ERRORS:
+            errors.append(BulkRowError(row=row, errors=messages))
+
+    async def flush():
+        nonlocal inserted
+        try:
+            inserted += await crud_product.bulk_insert_products(batch, session=session)
+        except (IntegrityError, DataError):
+            await session.rollback()
+            for row in batch_rows:
+                reject(row, ["Rejected by the database together with its batch."])
+        batch.clear()
+        batch_rows.clear()
+
+    async for row, raw in _iter_bulk_rows(request):
+        try:
+            product = ProductCreate.model_validate(raw)
+        except ValidationError as exc:
+            reject(row, [f"{'->'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}" for error in exc.errors()])
+            continue
+        if product.category_id not in category_ids:
+            reject(row, [f"category_id: Category with ID {product.category_id} not found"])
+            continue
+        batch.append(product.model_dump(include=set(crud_product.BULK_INSERT_COLUMNS)))
+        batch_rows.append(row)
+        if len(batch) >= BULK_CHUNK_SIZE:
+            await flush()
+    await flush()
+    await invalidate_stale(session)
+
+    return BulkProductReport(inserted=inserted, failed=failed, errors=errors,
+                             errors_truncated=failed > len(errors))
+
+@router.get("/", response_model=Union[List[ProductPublic], ProductFacetedList])
+@cache_tagged(expire=3600, namespace="get_all_products_list", tags=_listing_tags, prerender=True,
+              distributed=True)
+async def get_all_products_list(
+    session: AsyncSession = Depends(get_read_session),
     *,
-    _: Annotated[User, Depends(get_current_user)]
+    category_id: Optional[int] = Query(None, description="Only products in this category."),
+    price_min: Optional[float] = Query(None, ge=0, description="Only products costing at least this much."),
+    price_max: Optional[float] = Query(None, ge=0, description="Only products costing at most this much."),
+    min_rating: Optional[float] = Query(None, ge=1, le=5, description="Only products with at least this average rating."),
+    sort: Literal["id", "name", "price"] = Query("id"),
+    order: Literal["asc", "desc"] = Query("asc"),
+    facets: bool = Query(False, description="Return {items, facets} with per-category and price bucket counts."),
+    reviews_limit: ReviewsLimit = crud_product.EMBEDDED_REVIEWS_LIMIT,
+    _: Annotated[UserPublic, Depends(get_current_user)]
 ):
     """
-    Get a list of all products.
+    Get a list of all products, optionally filtered and with facet counts.
     """
-    products = await crud_product.get_all_products(session=session)
-    return products
+    filters = dict(category_id=category_id, price_min=price_min, price_max=price_max, min_rating=min_rating)
+    products = await crud_product.get_all_products(
+        session=session, sort=sort, descending=order == "desc", **filters)
+    reviews_next = await crud_product.attach_recent_reviews(products, session=session, limit=reviews_limit)
+    items = _with_reviews_next(products, reviews_next)
+    if not facets:
+        return items
+    product_facets = await crud_product.get_product_facets(session=session, **filters)
+    return ProductFacetedList(items=items, facets=product_facets)
 
-@router.get( "/paginated" , response_model=List[ProductPublic]) 
+@router.get( "/paginated" , response_model=Union[List[ProductPublic], ProductPage]) 
 async def get_paginated_products (
      skip: int = Query( 0 , ge= 0 , description= "How many items to skip from the beginning." ), 
      limit: int = Query( 10 , ge= 0 , le= 100 , description= "The maximum number of items to return per page." ), 
-        session: AsyncSession = Depends(get_session) ):
+     mode: Literal["offset", "cursor"] = Query("offset", description="'offset' uses skip/limit (legacy), 'cursor' uses keyset pagination."),
+     cursor: Optional[str] = Query(None, description="The next_cursor returned by the previous page (cursor mode only)."),
+     sort: Literal["id", "name", "price"] = Query("id", description="Sort order (cursor mode only)."),
+     order: Literal["asc", "desc"] = Query("asc", description="Sort direction (cursor mode only)."),
+     reviews_limit: ReviewsLimit = crud_product.EMBEDDED_REVIEWS_LIMIT,
+        session: AsyncSession = Depends(get_read_session) ):
         """ Get a paginated list of all products. """
+        if mode == "cursor":
+            if limit < 1:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                    detail="limit must be at least 1 in cursor mode.")
+            try:
+                products, next_cursor = await crud_product.get_products_keyset(
+                    session=session, limit=limit, cursor=cursor, sort=sort, descending=order == "desc")
+            except ValueError as exc:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+            reviews_next = await crud_product.attach_recent_reviews(products, session=session, limit=reviews_limit)
+            return ProductPage(items=_with_reviews_next(products, reviews_next), next_cursor=next_cursor)
         products = await crud_product.get_all_products_paginated(
                 skip=skip, limit=limit, session=session)
-        return products
+        reviews_next = await crud_product.attach_recent_reviews(products, session=session, limit=reviews_limit)
+        return _with_reviews_next(products, reviews_next)
+
+@router.get("/summary", response_model=ProductSummaryPage)
+async def get_product_summaries(
+    limit: int = Query(20, ge=1, le=100, description="The maximum number of items to return per page."),
+    cursor: Optional[str] = Query(None, description="The next_cursor returned by the previous page."),
+    sort: Literal["id", "name", "price"] = Query("id"),
+    order: Literal["asc", "desc"] = Query("asc"),
+    session: AsyncSession = Depends(get_read_session),
+    *,
+    _: Annotated[UserPublic, Depends(get_current_user)]
+):
+    """
+    List products with review count, average rating and rating histogram
+    instead of the full review list.
+    """
+    try:
+        products, next_cursor = await crud_product.get_products_keyset(
+            session=session, limit=limit, cursor=cursor, sort=sort,
+            descending=order == "desc")
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return ProductSummaryPage(items=products, next_cursor=next_cursor)
+
+@router.get("/search", response_model=ProductSummaryPage)
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=200, description="Words to look for in product names and descriptions."),
+    limit: int = Query(20, ge=1, le=100, description="The maximum number of items to return per page."),
+    cursor: Optional[str] = Query(None, description="The next_cursor returned by the previous page."),
+    session: AsyncSession = Depends(get_read_session)
+):
+    """
+    Search products by name and description, best matches first.
+    """
+    try:
+        products, next_cursor = await crud_product.search_products(
+            q=q, session=session, limit=limit, cursor=cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return ProductSummaryPage(items=products, next_cursor=next_cursor)
+
+EXPORT_FLUSH_EVERY = 100
+
+def _export_chunk(items: List[str], fmt: str, first: bool) -> str:
+    if fmt == "ndjson":
+        return "".join(item + "\n" for item in items)
+    chunk = ",".join(items)
+    return chunk if first else "," + chunk
+
+async def _export_products(fmt: str, session_factory: sessionmaker):
+    # The stream outlives the request handler, so it owns its session instead of
+    # borrowing the request-scoped one from get_read_session.
+    async with session_factory() as session:
+        buffer: List[str] = []
+        first = True
+        if fmt == "json":
+            yield "["
+        async for product in crud_product.stream_all_products(session=session):
+            buffer.append(ProductPublic.model_validate(product).model_dump_json())
+            if len(buffer) >= EXPORT_FLUSH_EVERY:
+                yield _export_chunk(buffer, fmt, first)
+                buffer, first = [], False
+        if buffer:
+            yield _export_chunk(buffer, fmt, first)
+        if fmt == "json":
+            yield "]"
+
+@router.get("/export")
+async def export_all_products(
+    request: Request,
+    format: Literal["ndjson", "json"] = Query("ndjson", description="'ndjson' streams one product per line, 'json' streams a single JSON array."),
+    *,
+    _: Annotated[UserPublic, Depends(get_current_user)]
+):
+    """
+    Stream the full product catalog without materializing it in memory.
+    """
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+    return StreamingResponse(_export_products(format, replicas.session_factory(request)), media_type=media_type)
 
 @router.get("/{product_id}", response_model=ProductPublic)
+@cache_tagged(expire=3600, namespace="get_product_details", tags=lambda product_id, **_: [f"product:{product_id}"], prerender=True)
 async def get_product_details(
     product_id: int,
-    session: AsyncSession = Depends(get_session)
+    reviews_limit: ReviewsLimit = crud_product.EMBEDDED_REVIEWS_LIMIT,
+    session: AsyncSession = Depends(get_read_session)
 ):
     """
     Get details for a specific product by ID.
@@ -61,4 +344,25 @@ async def get_product_details(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Product with ID {product_id} not found."
         )
-    return product
\ No newline at end of file
+    reviews_next = await crud_product.attach_recent_reviews([product], session=session, limit=reviews_limit)
+    return _with_reviews_next([product], reviews_next)[0]
+
+@router.get("/{product_id}/similar", response_model=List[SimilarProduct])
+async def get_similar_products(
+    product_id: int,
+    limit: int = Query(10, ge=1, le=50, description="How many related products to return."),
+    session: AsyncSession = Depends(get_read_session),
+    settings: Settings = Depends(get_settings)
+):
+    """
+    Get the products most similar to this one by name and description.
+    """
+    product = await crud_product.get_product_by_id(product_id=product_id, session=session)
+    if not product:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Product with ID {product_id} not found."
+        )
+    similar = await crud_product.get_similar_products(
+        product_id=product_id, session=session, limit=limit, embeddings_path=settings.EMBEDDINGS_PATH)
+    return [SimilarProduct.model_validate(item, update={"score": score}) for item, score in similar]
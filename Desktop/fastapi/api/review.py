@@ -1,11 +1,16 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+import logging
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlmodel.ext.asyncio.session import AsyncSession
-from core.db import get_session
-from crud import crud_review, crud_product
-from schema import ReviewCreate, ReviewPublic
+import redis.asyncio as redis
+from core.cache import cache_tagged, invalidate_stale
+from core.db import get_read_session, get_session
+from core.redis_client import get_redis
+from crud import crud_leaderboard, crud_review
+from schema import ReviewCreate, ReviewPage, ReviewPublic
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 class ReviewCreateWithUser(ReviewCreate):
     user_id: int
@@ -13,22 +18,36 @@ class ReviewCreateWithUser(ReviewCreate):
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=ReviewPublic)
 async def create_new_review(
     review_data: ReviewCreateWithUser,
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_session),
+    redis_client: redis.Redis = Depends(get_redis)
 ):
-    product = await crud_product.get_product_by_id(product_id=review_data.product_id, session=session)
-    if not product:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Product with ID {review_data.product_id} is not found")
     new_review = await crud_review.create_review(review_data=review_data, user_id=review_data.user_id, session=session)
+    if not new_review:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Product with ID {review_data.product_id} is not found")
+    await session.commit()
+    await invalidate_stale(session)
+    try:
+        await crud_leaderboard.record_product(redis_client, new_review.product)
+    except redis.RedisError:
+        # The review is stored; tasks.rebuild_leaderboards will catch the boards up
+        logger.warning("Could not update leaderboards for product %s", review_data.product_id, exc_info=True)
     return new_review
 
 
-@router.get("/product/{product_id}", response_model=List[ReviewPublic])
+@router.get("/product/{product_id}", response_model=ReviewPage)
+@cache_tagged(expire=3600, namespace="get_reviews_by_product", tags=lambda product_id, **_: [f"product:{product_id}"], prerender=True)
 async def get_reviews_by_product(
     product_id: int,
-    session: AsyncSession = Depends(get_session)
+    limit: int = Query(20, ge=1, le=100, description="The maximum number of reviews to return per page."),
+    cursor: Optional[str] = Query(None, description="The next_cursor of the previous page, or a product's reviews_next."),
+    session: AsyncSession = Depends(get_read_session)
 ):
     """
-    Get all reviews for a specific product.
+    Get the reviews for a specific product, newest first, one page at a time.
     """
-    reviews = await crud_review.get_reviews_for_product(product_id=product_id, session=session)
-    return reviews
\ No newline at end of file
+    try:
+        reviews, next_cursor = await crud_review.get_reviews_for_product(
+            product_id=product_id, session=session, limit=limit, cursor=cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return ReviewPage(items=reviews, next_cursor=next_cursor)
\ No newline at end of file
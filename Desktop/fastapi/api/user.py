@@ -4,14 +4,16 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 
 from core.db import get_session
 from crud import crud_user
-from schema import UserCreate, UserPublic
+from schema import UserCreate, UserPublic, UserRoleUpdate
 
+import time
 from typing import Annotated
-from core.auth import create_access_token, get_current_user
+import redis.asyncio as redis
+from core.auth import (ACCESS_TOKEN_EXPIRE_MINUTES, TokenClaims, create_access_token, get_current_user,
+                       get_token_claims, is_admin, revocations, user_cache)
+from core.revocation import token_entry, version_entry
 from fastapi.security import OAuth2PasswordRequestForm
-from core.security import verify_password
-
-from model.models import User
+from core.security import PasswordHasherBusy, verify_password
 
 router = APIRouter()
 
@@ -31,7 +33,12 @@ async def create_new_user(
             detail="A user with this username already exists.",
         )
     
-    new_user = await crud_user.create_user(user_data=user_data, session=session)
+    try:
+        new_user = await crud_user.create_user(user_data=user_data, session=session)
+    except PasswordHasherBusy as exc:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(exc),
+                            headers={"Retry-After": "1"})
+    await session.commit()
     return new_user
 
 @router.get("/{user_id}", response_model=UserPublic)
@@ -50,9 +57,42 @@ async def get_user_details(
         )
     return user
 
+@router.patch("/{user_id}/role", response_model=UserPublic, dependencies=[Depends(is_admin())])
+async def update_user_role(
+    user_id: int,
+    role_data: UserRoleUpdate,
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Change a user's role. Takes effect on their next request; the tokens they hold
+    carry the old role and are revoked, so they have to log in again.
+    """
+    user = await crud_user.update_user_role(user_id=user_id, role=role_data.role, session=session)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User with ID {user_id} not found.",
+        )
+    # Revoked before the commit: committed first, a failed revocation would leave the
+    # old tokens carrying the old role
+    entry = version_entry(user.username, user.token_version - 1)
+    try:
+        await revocations.revoke(entry, until=time.time() + ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+        await session.commit()
+    except Exception as exc:
+        await session.rollback()
+        await revocations.restore(entry)
+        if isinstance(exc, redis.RedisError):
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Could not revoke the user's tokens; the role was not changed.",
+                                headers={"Retry-After": "1"}) from exc
+        raise
+    await user_cache.invalidate(user.username)
+    return user
+
 @router.get("/my_session/", response_model=UserPublic)
 async def read_user_me(
-        current_user: Annotated[User, Depends(get_current_user)]):
+        current_user: Annotated[UserPublic, Depends(get_current_user)]):
     return current_user
 
 @router.post("/token", response_model=dict)
@@ -61,11 +101,24 @@ async def login_for_access_token(
         session: AsyncSession = Depends(get_session)):
     user = await crud_user.get_user_by_username(
         username=form_data.username, session=session)
-    if not user or not verify_password(form_data.password, user.password):
+    try:
+        valid = user is not None and await verify_password(form_data.password, user.password)
+    except PasswordHasherBusy as exc:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(exc),
+                            headers={"Retry-After": "1"})
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": user.username})
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+    access_token = create_access_token(data={"sub": user.username, "role": user.role, "ver": user.token_version})
+    return {"access_token": access_token, "token_type": "bearer"}
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(claims: Annotated[TokenClaims, Depends(get_token_claims)]):
+    """
+    Revoke the access token used for this request.
+    """
+    if claims.jti is not None:
+        await revocations.revoke(token_entry(claims.jti), until=claims.exp)
\ No newline at end of file
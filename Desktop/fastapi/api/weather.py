@@ -1,19 +1,60 @@
 from typing import Any
-from fastapi import APIRouter, Depends, HTTPException, status
-from external_services.weather import fetch_weather_data
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from external_services.weather import (WEATHER_BATCH_MAX, UnknownCity, WeatherReading, WeatherUnavailable,
+                                       get_weather, get_weather_batch)
+from schema import WeatherBatch, WeatherResult
 from core.config import get_settings, Settings
 from core.httpx_client import get_httpx_client
+from core.redis_client import get_redis
 import httpx
-from fastapi_cache.decorator import cache
-from fastapi_cache import FastAPICache
+import redis.asyncio as redis
 
 router = APIRouter()
 
+@router.get("/batch", response_model=WeatherBatch)
+async def get_weather_for_cities(
+    cities: str = Query(..., min_length=1, description="Comma-separated city names, e.g. berlin,paris,rome."),
+    settings: Settings = Depends(get_settings),
+    client: httpx.AsyncClient = Depends(get_httpx_client),
+    redis_client: redis.Redis = Depends(get_redis)
+    ):
+    """
+    Current weather for several cities in one call. Cities that can't be served
+    are listed in errors; the others are still returned.
+    """
+    names = list(dict.fromkeys(name.strip() for name in cities.split(",") if name.strip()))
+    if not names:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No city names given.")
+    if len(names) > WEATHER_BATCH_MAX:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"At most {WEATHER_BATCH_MAX} cities per request.")
+    readings = await get_weather_batch(names, settings=settings, client=client, redis_client=redis_client)
+    return WeatherBatch(
+        results={name: WeatherResult(status=reading.status, age=reading.age, data=reading.data)
+                 for name, reading in readings.items() if isinstance(reading, WeatherReading)},
+        errors={name: str(reading) for name, reading in readings.items() if isinstance(reading, WeatherUnavailable)},
+    )
+
+
 @router.get("/{city_name}")
-@cache(expire=300, namespace="get_weather_data")
 async def get_weather_data(
-    city_name: str, 
+    city_name: str,
+    response: Response,
     settings: Settings = Depends(get_settings),
-    client: httpx.AsyncClient = Depends(get_httpx_client)
+    client: httpx.AsyncClient = Depends(get_httpx_client),
+    redis_client: redis.Redis = Depends(get_redis)
     ) -> dict:
-    return await fetch_weather_data(city_name, settings, client)
+    """
+    Current weather for a city. X-Weather-Cache says where it came from (fresh,
+    stale while being refreshed, miss, or fallback when the upstream is failing)
+    and Age how old it is in seconds.
+    """
+    try:
+        reading = await get_weather(city_name, settings=settings, client=client, redis_client=redis_client)
+    except UnknownCity as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(exc))
+    except WeatherUnavailable as exc:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(exc))
+    response.headers["X-Weather-Cache"] = reading.status
+    response.headers["Age"] = str(reading.age)
+    return reading.data
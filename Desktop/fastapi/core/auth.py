@@ -1,13 +1,18 @@
-from typing import Optional
+import uuid
+from typing import NamedTuple, Optional
 from typing import Annotated
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlmodel import Session
 from decouple import config
-from .db import get_session
+from .config import get_settings
+from .db import AsyncSessionFactory
+from .revocation import RevocationList, token_entry, version_entry
+from .singleflight import flights
+from .user_cache import UserCache
 from crud.crud_user import get_user_by_username
+from schema import UserPublic
 
 
 SECRET_KEY = config("SECRET_KEY")
@@ -16,6 +21,10 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 oauth2_schema = OAuth2PasswordBearer(tokenUrl="/token")
 
+user_cache = UserCache(ttl=get_settings().AUTH_USER_CACHE_TTL, max_entries=get_settings().AUTH_USER_CACHE_SIZE)
+revocations = RevocationList(capacity=get_settings().AUTH_REVOCATION_CAPACITY,
+                             error_rate=get_settings().AUTH_REVOCATION_ERROR_RATE)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -23,13 +32,33 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    # Lets a single token be revoked, see revocations
+    to_encode.setdefault("jti", uuid.uuid4().hex)
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(
-    token: Annotated[str, Depends(oauth2_schema)],
-    session: Annotated[Session, Depends(get_session)]
-):
+async def _load_user(username: str) -> Optional[UserPublic]:
+    # Its own short session: most requests find the user cached and need none
+    async with AsyncSessionFactory() as session:
+        user = await get_user_by_username(username, session)
+    if user is None:
+        return None
+    user = UserPublic.model_validate(user)
+    await user_cache.put(username, user)
+    return user
+
+class TokenClaims(NamedTuple):
+    sub: str
+    exp: int
+    # Absent from tokens issued before they were added
+    role: Optional[str] = None
+    ver: Optional[int] = None
+    jti: Optional[str] = None
+
+async def get_token_claims(token: Annotated[str, Depends(oauth2_schema)]) -> TokenClaims:
+    """
+    The verified claims of a token that hasn't been revoked; no database access.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -42,14 +71,42 @@ async def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = await get_user_by_username(username, session)
-    if user is None:
+    claims = TokenClaims(sub=username, exp=payload["exp"], role=payload.get("role"),
+                         ver=payload.get("ver"), jti=payload.get("jti"))
+    entries = []
+    if claims.jti is not None:
+        entries.append(token_entry(claims.jti))
+    if claims.ver is not None:
+        entries.append(version_entry(claims.sub, claims.ver))
+    if entries and await revocations.is_revoked(*entries):
         raise credentials_exception
+    return claims
+
+async def _resolve_user(username: str) -> Optional[UserPublic]:
+    user = await user_cache.get(username)
+    if user is None:
+        # Concurrent misses for the same user share one query
+        user, _ = await flights.do(f"auth-user:{username}", lambda: _load_user(username))
+    return user
+
+async def get_current_user(claims: Annotated[TokenClaims, Depends(get_token_claims)]) -> UserPublic:
+    """
+    The user the token was issued to, from user_cache when it was resolved recently.
+    Changes to a user become visible once user_cache.invalidate() is called for
+    them, or at the latest after AUTH_USER_CACHE_TTL seconds.
+    """
+    user = await _resolve_user(claims.sub)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
 def role_checker(roles: list[str]):
     def check_roles_dependency(
-        current_user: Annotated[dict, Depends(get_current_user)]
+        current_user: Annotated[UserPublic, Depends(get_current_user)]
     ):
         if current_user.role not in roles:
             raise HTTPException(
@@ -59,8 +116,30 @@ def role_checker(roles: list[str]):
         return current_user
     return check_roles_dependency
 
+def claims_role_checker(roles: list[str]):
+    """
+    role_checker that trusts the role in the token instead of looking the user up.
+    A role change revokes the user's older tokens (see api.user.update_user_role),
+    so the claim can't outlive it.
+    """
+    async def check_claims_dependency(
+        claims: Annotated[TokenClaims, Depends(get_token_claims)]
+    ):
+        role = claims.role
+        if role is None:
+            # Tokens from before roles were put in the claims
+            user = await _resolve_user(claims.sub)
+            role = user.role if user is not None else None
+        if role not in roles:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="User not authorized for this action."
+            )
+        return claims
+    return check_claims_dependency
+
 def is_admin():
-    return role_checker(["admin"])
+    return claims_role_checker(["admin"])
 
 def is_customer():
-    return role_checker(["customer"])
\ No newline at end of file
+    return claims_role_checker(["customer"])
\ No newline at end of file
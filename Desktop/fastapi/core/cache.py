@@ -0,0 +1,481 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlencode
+
+import redis.asyncio as redis
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.routing import serialize_response
+from fastapi_cache import FastAPICache, default_key_builder
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.coder import Coder
+from fastapi_cache.decorator import cache
+from fastapi_cache.types import Backend
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.requests import Request
+from starlette.responses import Response
+
+from core.config import get_settings
+from core.singleflight import acquire_or_wait, copy_result, flights, release, request_key
+
+logger = logging.getLogger(__name__)
+
+
+def request_key_builder(
+    func: Callable[..., Any],
+    namespace: str = "",
+    *,
+    request: Optional[Request] = None,
+    response: Optional[Response] = None,
+    args: Tuple[Any, ...],
+    kwargs: Dict[str, Any],
+) -> str:
+    """
+    Cache key from the request path and its (sorted) query parameters only.
+    The default builder hashes the repr of every argument, which includes the
+    injected AsyncSession / httpx client: new objects on every request, so the
+    key never repeated and the cache never hit.
+    """
+    if request is None:
+        # Called outside a request (e.g. directly from code): nothing else to key on
+        return default_key_builder(func, namespace, args=args, kwargs=kwargs)
+    query = urlencode(sorted(request.query_params.multi_items()))
+    digest = hashlib.md5(f"{request.url.path}?{query}".encode()).hexdigest()  # noqa: S324
+    return f"{namespace}:{digest}"
+
+
+class NamespaceStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.get_seconds = 0.0
+
+    def as_dict(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "avg_get_ms": round(self.get_seconds * 1000 / lookups, 3) if lookups else None,
+        }
+
+
+class InstrumentedBackend(Backend):
+    """
+    Wraps a fastapi_cache backend and counts hits, misses, errors and lookup
+    latency per cache namespace (keys look like "<prefix>:<namespace>:<hash>").
+    """
+
+    def __init__(self, backend: Backend):
+        self.backend = backend
+        self.stats: Dict[str, NamespaceStats] = defaultdict(NamespaceStats)
+
+    @staticmethod
+    def _namespace(key: str) -> str:
+        parts = key.split(":")
+        return parts[1] if len(parts) > 2 else parts[0]
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        stats = self.stats[self._namespace(key)]
+        start = time.perf_counter()
+        try:
+            ttl, value = await self.backend.get_with_ttl(key)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.get_seconds += time.perf_counter() - start
+        if value is None:
+            stats.misses += 1
+        else:
+            stats.hits += 1
+        return ttl, value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.backend.get(key)
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        await self.backend.set(key, value, expire)
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        return await self.backend.clear(namespace, key)
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> List[str]:
+        return await self.backend.invalidate_tags(tags)
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {namespace: stats.as_dict() for namespace, stats in sorted(self.stats.items())}
+
+
+# --- Tag-based invalidation ----------------------------------------------------
+# A cached response can carry entity tags ("product:42", "category:3", "catalog").
+# Every tag has a Redis set of the cache keys stored under it, so a write can drop
+# exactly the responses that embed what it changed, and cached reads can keep long
+# TTLs instead of waiting for stale data to expire.
+
+_response_tags: ContextVar[Tuple[str, ...]] = ContextVar("response_tags", default=())
+
+STALE_TAGS_KEY = "stale_cache_tags"
+
+# How long a worker may hold the lock for recomputing a missed entry (cache_tagged(distributed=True))
+DISTRIBUTED_LOCK_TIMEOUT = 5
+
+
+class TaggedRedisBackend(RedisBackend):
+    """
+    RedisBackend that also indexes each stored key under the tags of the response
+    being cached (set by cache_tagged for the duration of the request).
+    """
+
+    def tag_key(self, tag: str) -> str:
+        return f"{FastAPICache.get_prefix()}:tag:{tag}"
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        tags = _response_tags.get()
+        if not tags:
+            await super().set(key, value, expire)
+            return
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(key, value, ex=expire)
+            for tag in tags:
+                tag_key = self.tag_key(tag)
+                pipe.sadd(tag_key, key)
+                if expire:
+                    # The index lives as long as the longest-lived entry it points to
+                    pipe.expire(tag_key, expire, nx=True)
+                    pipe.expire(tag_key, expire, gt=True)
+            await pipe.execute()
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> List[str]:
+        """
+        Deletes every entry stored under any of the tags; returns their keys.
+        """
+        tag_keys = [self.tag_key(tag) for tag in tags]
+        if not tag_keys:
+            return []
+        keys = [key.decode() if isinstance(key, bytes) else key for key in await self.redis.sunion(tag_keys)]
+        await self.redis.delete(*keys, *tag_keys)
+        return keys
+
+
+def cache_tagged(
+    expire: int,
+    namespace: str,
+    tags: Union[Iterable[str], Callable[..., Iterable[str]]],
+    prerender: bool = False,
+    coalesce: bool = True,
+    distributed: bool = False,
+):
+    """
+    fastapi_cache's @cache, plus entity tags for the cached response. `tags` is
+    either a fixed list or a function of the route's keyword arguments, e.g.
+    lambda product_id, **_: [f"product:{product_id}"].
+
+    With prerender=True the route's response is validated and encoded once, on the
+    miss, and the finished body is what gets cached (see ResponseCoder): a hit
+    returns the stored bytes as they are, without decoding, response_model
+    validation or re-encoding.
+
+    coalesce: concurrent identical requests in this process share one lookup and,
+    on a miss, one run of the endpoint. distributed: on a miss, workers also
+    coordinate through a short Redis lock, and the ones that did not get it wait
+    and serve what the lock holder cached.
+    """
+    def wrapper(func):
+        cache_namespace = f"{namespace}:rendered" if prerender else namespace
+        coder = ResponseCoder if prerender else None
+
+        @wraps(func)
+        async def compute(*args, **kwargs):
+            # Only reached on a cache miss
+            request = _current_request.get()
+            lock = None
+            if distributed and flights.enabled and request is not None:
+                cache_key = request_key_builder(
+                    func, f"{FastAPICache.get_prefix()}:{cache_namespace}", request=request, args=args, kwargs=kwargs)
+                try:
+                    lock = await acquire_or_wait(request.app.state.redis, f"{cache_key}:lock", DISTRIBUTED_LOCK_TIMEOUT)
+                    if lock is None:
+                        value = await FastAPICache.get_backend().get(cache_key)
+                        if value is not None:
+                            return (coder or FastAPICache.get_coder()).decode(value)
+                except redis.RedisError:
+                    logger.warning("Could not coordinate %s with the other workers", cache_key, exc_info=True)
+            try:
+                result = await func(*args, **kwargs)
+                return await _render_response(result) if prerender else result
+            finally:
+                if lock is not None:
+                    await release(lock)
+
+        # Own key space for pre-rendered entries: ones stored by the plain JSON
+        # coder can't be read back as responses
+        cached = cache(expire=expire, namespace=cache_namespace, coder=coder, key_builder=request_key_builder)(compute)
+
+        @wraps(cached)
+        async def inner(*args, **kwargs):
+            request = next((value for value in kwargs.values() if isinstance(value, Request)), None)
+
+            async def run():
+                response_tags = tags(**kwargs) if callable(tags) else tags
+                tags_token = _response_tags.set(tuple(response_tags))
+                request_token = _current_request.set(request)
+                try:
+                    result = await cached(*args, **kwargs)
+                finally:
+                    _response_tags.reset(tags_token)
+                    _current_request.reset(request_token)
+                if prerender:
+                    # FastAPI sends a returned Response as is, so the cache headers that
+                    # @cache put on the injected one have to be carried over
+                    sub_response = next((value for value in kwargs.values() if isinstance(value, Response)), None)
+                    if sub_response is not None and result is not sub_response:
+                        result.headers.update(sub_response.headers)
+                return result
+
+            if not coalesce or request is None or request.method != "GET":
+                return await run()
+            result, shared = await flights.do(request_key(request), run)
+            return copy_result(result) if shared else result
+
+        # What a miss reads is served to every client until the next invalidation,
+        # so it must not come from a replica that hasn't caught up with the write
+        # behind it; see ReplicaSet.session_factory
+        inner.reads_from_primary = True
+        return inner
+
+    return wrapper
+
+
+# --- Pre-rendered responses ---------------------------------------------------------
+
+_current_request: ContextVar[Optional[Request]] = ContextVar("current_request", default=None)
+
+# zlib level for stored responses; decompression costs about the same at any level
+COMPRESS_LEVEL = 6
+
+
+async def _render_response(result: Any) -> Response:
+    """
+    Turns an endpoint's return value into the Response FastAPI would have sent,
+    using the matched route's response_model, filters and response class.
+    """
+    if isinstance(result, Response):
+        return result
+    route = _current_request.get().scope["route"]
+    content = await serialize_response(
+        field=route.secure_cloned_response_field,
+        response_content=result,
+        include=route.response_model_include,
+        exclude=route.response_model_exclude,
+        by_alias=route.response_model_by_alias,
+        exclude_unset=route.response_model_exclude_unset,
+        exclude_defaults=route.response_model_exclude_defaults,
+        exclude_none=route.response_model_exclude_none,
+    )
+    response_class = route.response_class
+    if isinstance(response_class, DefaultPlaceholder):
+        response_class = response_class.value
+    return response_class(content, status_code=route.status_code or 200)
+
+
+class ResponseCoder(Coder):
+    """
+    Stores a rendered Response (status, headers, body) and gives it back as a
+    Response. Stored values of CACHE_COMPRESS_MIN_BYTES or more are zlib-compressed;
+    the first byte says which, so the setting can change under a live cache.
+    """
+
+    @classmethod
+    def encode(cls, value: Response) -> bytes:
+        meta = json.dumps({
+            "s": value.status_code,
+            "h": [(name, header) for name, header in value.headers.items() if name != "content-length"],
+        }).encode()
+        payload = len(meta).to_bytes(4, "big") + meta + bytes(value.body)
+        min_bytes = get_settings().CACHE_COMPRESS_MIN_BYTES
+        if min_bytes and len(payload) >= min_bytes:
+            return b"Z" + zlib.compress(payload, COMPRESS_LEVEL)
+        return b"R" + payload
+
+    @classmethod
+    def decode(cls, value: bytes) -> Response:
+        payload = zlib.decompress(value[1:]) if value[:1] == b"Z" else memoryview(value)[1:]
+        meta_size = int.from_bytes(payload[:4], "big")
+        meta = json.loads(bytes(payload[4:4 + meta_size]))
+        return Response(content=bytes(payload[4 + meta_size:]), status_code=meta["s"], headers=dict(meta["h"]))
+
+    @classmethod
+    def decode_as_type(cls, value: bytes, *, type_: Any) -> Response:
+        return cls.decode(value)
+
+
+def mark_stale(session: AsyncSession, *tags: str) -> None:
+    """
+    Records cache tags made stale by a write in this session; they are dropped by
+    invalidate_stale once the caller has committed.
+    """
+    session.info.setdefault(STALE_TAGS_KEY, set()).update(tags)
+
+
+async def invalidate_tags(*tags: str) -> None:
+    try:
+        await FastAPICache.get_backend().invalidate_tags(tags)
+    except redis.RedisError:
+        logger.warning("Could not invalidate cache tags %s", sorted(tags), exc_info=True)
+
+
+async def invalidate_stale(session: AsyncSession) -> None:
+    tags = session.info.pop(STALE_TAGS_KEY, None)
+    if tags:
+        await invalidate_tags(*tags)
+
+
+# --- In-process L1 ---------------------------------------------------------------
+# Each worker keeps the hottest entries in memory in front of Redis, so most hits
+# skip the network round-trip. Entries live at most `ttl` seconds (never longer
+# than in Redis) and the LRU is bounded by the byte size of the stored values.
+# Invalidations are broadcast on a Redis channel so every worker drops its copy.
+
+INVALIDATION_CHANNEL = "fastapi-cache:invalidate"
+
+# Rough per-entry bookkeeping cost (dict slot, tuple, key object) counted against max_bytes
+ENTRY_OVERHEAD_BYTES = 128
+
+
+class L1Backend(Backend):
+    def __init__(self, backend: Backend, redis_client: redis.Redis, max_bytes: int, ttl: int):
+        self.backend = backend
+        self.redis = redis_client
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> (expires at on the monotonic clock, value)
+        self.entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self.size = 0
+        self.hits: Dict[str, int] = defaultdict(int)
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _entry_size(key: str, value: bytes) -> int:
+        return len(key) + len(value) + ENTRY_OVERHEAD_BYTES
+
+    def _drop(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= self._entry_size(key, entry[1])
+
+    def _store(self, key: str, value: bytes, ttl: Optional[int]) -> None:
+        self._drop(key)
+        size = self._entry_size(key, value)
+        if size > self.max_bytes // 4:
+            return  # one huge response would flush everything else; leave it to Redis
+        lifetime = min(ttl, self.ttl) if ttl and ttl > 0 else self.ttl
+        self.entries[key] = (time.monotonic() + lifetime, value)
+        self.size += size
+        while self.size > self.max_bytes:
+            evicted, (_, evicted_value) = self.entries.popitem(last=False)
+            self.size -= self._entry_size(evicted, evicted_value)
+            self.evictions += 1
+
+    def _lookup(self, key: str) -> Optional[Tuple[int, bytes]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        remaining = entry[0] - time.monotonic()
+        if remaining <= 0:
+            self._drop(key)
+            return None
+        self.entries.move_to_end(key)
+        return max(int(remaining), 1), entry[1]
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        local = self._lookup(key)
+        if local is not None:
+            self.hits[InstrumentedBackend._namespace(key)] += 1
+            return local
+        ttl, value = await self.backend.get_with_ttl(key)
+        if value is not None:
+            self._store(key, value, ttl)
+        return ttl, value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        local = self._lookup(key)
+        if local is not None:
+            return local[1]
+        return await self.backend.get(key)
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        await self.backend.set(key, value, expire)
+        self._store(key, value, expire)
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        cleared = await self.backend.clear(namespace, key)
+        if namespace:
+            await self._broadcast({"prefix": f"{namespace}:"})
+        elif key:
+            await self._broadcast({"keys": [key]})
+        return cleared
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> List[str]:
+        keys = await self.backend.invalidate_tags(tags)
+        if keys:
+            await self._broadcast({"keys": keys})
+        return keys
+
+    async def _broadcast(self, message: dict) -> None:
+        # Applied here right away; the other workers get it over pub/sub
+        self._apply(message)
+        await self.redis.publish(INVALIDATION_CHANNEL, json.dumps(message))
+
+    def _apply(self, message: dict) -> None:
+        self.invalidations += 1
+        for key in message.get("keys", ()):
+            self._drop(key)
+        prefix = message.get("prefix")
+        if prefix:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                self._drop(key)
+
+    def clear_local(self) -> None:
+        self.entries.clear()
+        self.size = 0
+
+    async def listen(self) -> None:
+        """
+        Applies invalidations published by the other workers; runs for the lifetime
+        of the app (started in main.lifespan). Whenever the subscription is (re)made
+        the local cache is emptied, since messages sent in between are lost.
+        """
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    self.clear_local()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._apply(json.loads(message["data"]))
+            except redis.RedisError:
+                logger.warning("Cache invalidation subscription lost, retrying", exc_info=True)
+                self.clear_local()
+                await asyncio.sleep(1)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hits": dict(sorted(self.hits.items())),
+        }
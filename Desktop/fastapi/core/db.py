@@ -1,9 +1,18 @@
+from fastapi import Request
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.orm import sessionmaker
 from .config import get_settings
+from .db_pool import engine_options
+from .replicas import ReplicaSet, read_session_factory
+from .sql_metrics import instrument_engine, raise_on_lazy_loads
 
-engine = create_async_engine(url= get_settings().DATABASE_URL, echo= True)
+settings = get_settings()
+engine = create_async_engine(url= settings.DATABASE_URL, echo= settings.SQL_ECHO,
+                             **engine_options(settings.DATABASE_URL, settings, asynchronous=True))
+instrument_engine(engine.sync_engine)
+if settings.SQL_RAISE_ON_LAZY_LOAD:
+    raise_on_lazy_loads()
 
 AsyncSessionFactory = sessionmaker(
     engine,
@@ -11,11 +20,25 @@ AsyncSessionFactory = sessionmaker(
     expire_on_commit=False
 )
 
+replicas = ReplicaSet(settings, primary=read_session_factory(engine))
+
 async def get_session():
+    # Write endpoints commit explicitly before returning, so the client never gets
+    # a success response for a transaction that later fails to commit; this final
+    # commit then has nothing left to do and sends nothing.
     async with AsyncSessionFactory() as session:
         try:
             yield session
             await session.commit()  # Fixed: added 'await' for async commit
         except Exception:
             await session.rollback()
-            raise
\ No newline at end of file
+            raise
+
+async def get_read_session(request: Request):
+    """
+    A read-only session for GET endpoints, on one of the read replicas (see
+    core.replicas.ReplicaSet) or on the primary when there are none. Flushing
+    it raises; anything that writes must use get_session.
+    """
+    async with replicas.session_factory(request)() as session:
+        yield session
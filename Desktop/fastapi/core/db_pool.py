@@ -0,0 +1,108 @@
+import time
+import uuid
+
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from core.config import Settings
+
+
+class _TimedPool:
+    """
+    Times every checkout (waiting for a free connection, opening one, pre-ping)
+    and counts checkouts that gave up after DB_POOL_TIMEOUT.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        wait = time.perf_counter() - start
+        self.checkouts += 1
+        self.wait_seconds += wait
+        self.max_wait_seconds = max(self.max_wait_seconds, wait)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() swaps in a new pool; keep counting where this one left off
+        pool = super().recreate()
+        pool.checkouts = self.checkouts
+        pool.timeouts = self.timeouts
+        pool.wait_seconds = self.wait_seconds
+        pool.max_wait_seconds = self.max_wait_seconds
+        return pool
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "idle": self.checkedin(),
+            # overflow() counts down from -size while the pool is still filling up
+            "overflow": max(self.overflow(), 0),
+            "max_overflow": self._max_overflow,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.wait_seconds * 1000 / self.checkouts, 3) if self.checkouts else None,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+        }
+
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def _prepared_statement_name() -> str:
+    return f"__asyncpg_{uuid.uuid4().hex}__"
+
+
+def engine_options(url: str, settings: Settings, asynchronous: bool) -> dict:
+    """
+    Keyword arguments for create_engine/create_async_engine from the DB_POOL_*
+    settings, for one pool per process (so per uvicorn or Celery worker).
+
+    DB_PGBOUNCER is for PgBouncer in transaction pooling mode: consecutive
+    statements of a session may reach different server connections there, so
+    asyncpg must not cache prepared statements, and the ones it still prepares
+    get unique names. psycopg2 doesn't prepare statements server side.
+    """
+    parsed = make_url(url)
+    options = {"pool_pre_ping": settings.DB_POOL_PRE_PING, "pool_recycle": settings.DB_POOL_RECYCLE}
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        # In-memory SQLite lives in its one connection; keep SQLAlchemy's StaticPool
+        return options
+    options.update(
+        poolclass=TimedAsyncQueuePool if asynchronous else TimedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+    )
+    if settings.DB_PGBOUNCER and parsed.get_driver_name() == "asyncpg":
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": _prepared_statement_name,
+        }
+    return options
+
+
+def pool_stats(engine: Engine) -> dict:
+    """Connections of engine's pool; pass engine.sync_engine for an async engine."""
+    pool = engine.pool
+    if isinstance(pool, _TimedPool):
+        return pool.stats()
+    return {"pool": type(pool).__name__, "status": pool.status()}
@@ -0,0 +1,154 @@
+import math
+import os
+import re
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Width of the product embedding vectors (and of the product_embedding.embedding column)
+EMBEDDING_DIM = 256
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbedder:
+    """
+    TF-IDF over the hashing trick: tokens are hashed into `dim` buckets (with a
+    hash-derived sign so collisions tend to cancel out) instead of keeping a
+    vocabulary. fit() learns per-bucket IDF from the catalog; embed() returns
+    L2-normalized float32 rows, so a dot product is the cosine similarity.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.idf = np.ones(dim, dtype=np.float32)
+
+    def _buckets(self, text: str) -> Dict[int, float]:
+        counts: Dict[int, float] = {}
+        for token in _TOKEN_RE.findall(text.lower()):
+            # crc32 rather than hash(): buckets must not change between processes
+            digest = zlib.crc32(token.encode())
+            bucket = digest % self.dim
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            counts[bucket] = counts.get(bucket, 0.0) + sign
+        return counts
+
+    def fit(self, documents: Iterable[str]) -> "HashingEmbedder":
+        document_frequency = np.zeros(self.dim, dtype=np.float64)
+        n_documents = 0
+        for document in documents:
+            n_documents += 1
+            for bucket in self._buckets(document):
+                document_frequency[bucket] += 1
+        self.idf = (np.log((1 + n_documents) / (1 + document_frequency)) + 1).astype(np.float32)
+        return self
+
+    def embed(self, documents: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(documents), self.dim), dtype=np.float32)
+        for row, document in enumerate(documents):
+            for bucket, count in self._buckets(document).items():
+                # sublinear term frequency, keeping the hash sign
+                matrix[row, bucket] = math.copysign(1 + math.log(abs(count)), count) if count else 0.0
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+EMBEDDERS = {
+    "hashing": HashingEmbedder,
+}
+
+
+def get_embedder(name: str) -> HashingEmbedder:
+    try:
+        return EMBEDDERS[name](EMBEDDING_DIM)
+    except KeyError:
+        raise ValueError(f"Unknown embedder '{name}', expected one of {sorted(EMBEDDERS)}")
+
+
+def product_document(name: str, description: str) -> str:
+    return f"{name} {name} {description}"  # the name counts twice, it says more than the description
+
+
+# --- NumPy fallback index ------------------------------------------------------
+# Without pgvector the embeddings live in two .npy files written by
+# tasks.embed_products: <path>.npy, the (n, dim) matrix, and <path>.ids.npy,
+# the matching product ids in ascending order.
+
+def create_embedding_matrix(path: str, rows: int, dim: int = EMBEDDING_DIM) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Opens writable memory-mapped (ids, matrix) files next to the target, to be
+    filled in chunks and swapped in with publish_embedding_matrix, so readers
+    never see half a file and the matrix never has to fit in memory.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    ids = np.lib.format.open_memmap(f"{path}.ids.tmp.npy", mode="w+", dtype=np.int64, shape=(rows,))
+    matrix = np.lib.format.open_memmap(f"{path}.tmp.npy", mode="w+", dtype=np.float32, shape=(rows, dim))
+    return ids, matrix
+
+
+def publish_embedding_matrix(path: str, ids: np.ndarray, matrix: np.ndarray, rows: Optional[int] = None,
+                             chunk_rows: int = 65536) -> None:
+    """
+    Swaps in the files from create_embedding_matrix. When only the first `rows`
+    rows were filled (products deleted meanwhile), only those are published: the
+    unfilled tail would break the sorted ids top_k_similar searches.
+    """
+    if rows is not None and rows < len(ids):
+        ids_out = np.lib.format.open_memmap(f"{path}.ids.trim.npy", mode="w+", dtype=ids.dtype, shape=(rows,))
+        matrix_out = np.lib.format.open_memmap(f"{path}.trim.npy", mode="w+", dtype=matrix.dtype,
+                                               shape=(rows, matrix.shape[1]))
+        ids_out[:] = ids[:rows]
+        for start in range(0, rows, chunk_rows):
+            matrix_out[start:start + chunk_rows] = matrix[start:min(start + chunk_rows, rows)]
+        del ids, matrix
+        os.remove(f"{path}.ids.tmp.npy")
+        os.remove(f"{path}.tmp.npy")
+        os.replace(f"{path}.ids.trim.npy", f"{path}.ids.tmp.npy")
+        os.replace(f"{path}.trim.npy", f"{path}.tmp.npy")
+        ids, matrix = ids_out, matrix_out
+    ids.flush()
+    matrix.flush()
+    os.replace(f"{path}.ids.tmp.npy", f"{path}.ids.npy")
+    os.replace(f"{path}.tmp.npy", f"{path}.npy")
+
+
+_loaded: Dict[str, Tuple[float, np.ndarray, np.ndarray]] = {}
+
+
+def load_embedding_matrix(path: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Returns (ids, matrix) with the matrix memory-mapped rather than read into memory,
+    or None if no embeddings were built yet. Reloaded when the file is replaced.
+    """
+    try:
+        mtime = os.stat(f"{path}.npy").st_mtime
+    except FileNotFoundError:
+        return None
+    cached = _loaded.get(path)
+    if cached is None or cached[0] != mtime:
+        ids = np.load(f"{path}.ids.npy")
+        matrix = np.load(f"{path}.npy", mmap_mode="r")
+        cached = (mtime, ids, matrix)
+        _loaded[path] = cached
+    return cached[1], cached[2]
+
+
+def top_k_similar(ids: np.ndarray, matrix: np.ndarray, product_id: int, k: int) -> List[Tuple[int, float]]:
+    """
+    Brute-force cosine top-k for one product: a single matrix-vector product over
+    every row, then argpartition instead of a full sort.
+    """
+    row = int(np.searchsorted(ids, product_id))
+    if row >= len(ids) or ids[row] != product_id or k <= 0:
+        return []
+    scores = np.asarray(matrix @ matrix[row])
+    scores[row] = -np.inf
+    k = min(k, len(ids) - 1)
+    if k <= 0:
+        return []
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best])]
+    return [(int(ids[i]), float(scores[i])) for i in best]
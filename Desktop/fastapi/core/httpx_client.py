@@ -1,7 +1,98 @@
+import logging
+import time
+
 import httpx
-from typing import AsyncGenerator
+from fastapi import Request
+
+from core.config import Settings
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    Counts requests, errors, requests in flight and time to response headers
+    around the pooled transport, and reads the pool's connection counts.
+    """
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport):
+        self.transport = transport
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.seconds = 0.0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            return await self.transport.handle_async_request(request)
+        except httpx.HTTPError:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.seconds += time.perf_counter() - start
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+    def stats(self) -> dict:
+        # httpx keeps its httpcore pool private; read it defensively
+        connections = getattr(getattr(self.transport, "_pool", None), "connections", [])
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "avg_ms": round(self.seconds * 1000 / self.requests, 3) if self.requests else None,
+            "connections": len(connections),
+            "connections_active": len(connections) - idle,
+            "connections_idle": idle,
+            "http2_connections": sum(1 for connection in connections if ", HTTP/2," in connection.info()),
+        }
+
+
+def create_httpx_client(settings: Settings) -> httpx.AsyncClient:
+    """
+    The application's outgoing HTTP client, created once in main.lifespan so that
+    connections (and their TLS sessions) are reused across requests.
+    """
+    http2 = settings.HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HTTP2 is enabled but the h2 package is not installed; using HTTP/1.1")
+            http2 = False
+    transport = httpx.AsyncHTTPTransport(
+        http2=http2,
+        # Retries only cover failing to connect, which is safe for any request
+        retries=settings.HTTP_RETRIES,
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+    return httpx.AsyncClient(
+        transport=InstrumentedTransport(transport),
+        timeout=httpx.Timeout(
+            connect=settings.HTTP_CONNECT_TIMEOUT,
+            read=settings.HTTP_READ_TIMEOUT,
+            write=settings.HTTP_READ_TIMEOUT,
+            pool=settings.HTTP_POOL_TIMEOUT,
+        ),
+    )
+
+
+def client_stats(client: httpx.AsyncClient) -> dict:
+    # The client doesn't expose its transport; this is the one place that reaches in
+    transport = client._transport
+    return transport.stats() if isinstance(transport, InstrumentedTransport) else {}
 
 
-async def get_httpx_client() -> AsyncGenerator[httpx.AsyncClient, None]:
-    async with httpx.AsyncClient() as client:
-        yield client
\ No newline at end of file
+def get_httpx_client(request: Request) -> httpx.AsyncClient:
+    # The client is created once in main.lifespan and shared by every request
+    return request.app.state.httpx_client
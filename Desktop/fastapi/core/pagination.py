@@ -0,0 +1,64 @@
+import base64
+import json
+from typing import Any, Optional, Tuple
+
+from sqlalchemy import tuple_
+
+
+def encode_cursor(sort: str, key: Any, row_id: int) -> str:
+    """
+    Build an opaque cursor from the last row of a page: its sort key and id.
+    """
+    raw = json.dumps({"s": sort, "k": key, "i": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[Any, int]:
+    """
+    Turn a cursor back into (sort key, id).
+    Raises ValueError if the cursor is malformed or was issued for another sort order.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key, row_id = data["k"], int(data["i"])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid pagination cursor.")
+    if data.get("s") != sort:
+        raise ValueError("Cursor was issued for a different sort order.")
+    return key, row_id
+
+
+def keyset_filter(sort_column, id_column, key: Any, row_id: int, descending: bool = False):
+    """
+    WHERE clause that continues a (sort_column, id) ordered scan after the given row.
+    The id tiebreaker keeps the order stable when sort keys repeat.
+    """
+    if sort_column is id_column:
+        return id_column < row_id if descending else id_column > row_id
+    if descending:
+        return tuple_(sort_column, id_column) < tuple_(key, row_id)
+    return tuple_(sort_column, id_column) > tuple_(key, row_id)
+
+
+def keyset_order(sort_column, id_column, descending: bool = False):
+    if sort_column is id_column:
+        return (id_column.desc(),) if descending else (id_column,)
+    if descending:
+        return (sort_column.desc(), id_column.desc())
+    return (sort_column, id_column)
+
+
+def next_cursor(rows: list, limit: int, sort: str, sort_attr: str) -> Tuple[list, Optional[str]]:
+    """
+    Given rows fetched with limit + 1, trim the look-ahead row and return the
+    page together with the cursor for the next one (None on the last page).
+    """
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    if not page:
+        # limit=0: there is no last row to continue from
+        return page, None
+    last = page[-1]
+    return page, encode_cursor(sort, getattr(last, sort_attr), last.id)
@@ -0,0 +1,7 @@
+import redis.asyncio as redis
+from fastapi import Request
+
+
+def get_redis(request: Request) -> redis.Redis:
+    # The client is created once in main.lifespan and shared by every request
+    return request.app.state.redis
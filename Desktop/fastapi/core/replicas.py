@@ -0,0 +1,173 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Optional
+
+from sqlalchemy import event, exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import Settings
+from core.db_pool import engine_options, pool_stats
+from core.sql_metrics import instrument_engine
+
+logger = logging.getLogger(__name__)
+
+# Set on responses to writes; holds the time until which the client reads from the primary
+READ_YOUR_WRITES_COOKIE = "db_primary_until"
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class ReadOnlySession(Session):
+    """Sync side of the sessions get_read_session hands out."""
+
+
+@event.listens_for(ReadOnlySession, "before_flush")
+def _refuse_flush(session, flush_context, instances):
+    # Replicas would silently diverge from the primary; writes go through get_session
+    raise exc.InvalidRequestError("This session is read-only; use core.db.get_session to write.")
+
+
+def read_session_factory(engine: AsyncEngine) -> sessionmaker:
+    return sessionmaker(engine, class_=AsyncSession, sync_session_class=ReadOnlySession, expire_on_commit=False)
+
+
+class Replica:
+    def __init__(self, url: str, settings: Settings):
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self.engine = create_async_engine(url, echo=settings.SQL_ECHO,
+                                          **engine_options(url, settings, asynchronous=True))
+        instrument_engine(self.engine.sync_engine)
+        self.sessions = read_session_factory(self.engine)
+        # Trusted until the first health check says otherwise
+        self.healthy = True
+        self.last_error: Optional[str] = None
+        self.served = 0
+
+    def stats(self) -> dict:
+        return {
+            "url": self.name,
+            "healthy": self.healthy,
+            "last_error": self.last_error,
+            "sessions": self.served,
+            "pool": pool_stats(self.engine.sync_engine),
+        }
+
+
+class ReplicaSet:
+    """
+    Read replicas (DATABASE_REPLICA_URLS), used round-robin by get_read_session.
+    Replicas failing a health check are skipped until they pass one again; with
+    none healthy, or within DB_READ_YOUR_WRITES_SECONDS of a client's own write,
+    reads go to the primary. So do those of endpoints marked reads_from_primary
+    (the cache_tagged ones), whose results outlive the request.
+    """
+
+    def __init__(self, settings: Settings, primary: sessionmaker):
+        self.primary = primary
+        self.replicas = [Replica(url.strip(), settings)
+                         for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+        self.check_interval = settings.DB_REPLICA_CHECK_INTERVAL
+        self.check_timeout = settings.DB_REPLICA_CHECK_TIMEOUT
+        self._next = itertools.count()
+        self.primary_reads = 0
+        self.sticky_reads = 0
+        self.cache_fill_reads = 0
+
+    def choose(self, sticky: bool = False) -> sessionmaker:
+        if not sticky and self.replicas:
+            start = next(self._next)
+            for offset in range(len(self.replicas)):
+                replica = self.replicas[(start + offset) % len(self.replicas)]
+                if replica.healthy:
+                    replica.served += 1
+                    return replica.sessions
+        self.primary_reads += 1
+        self.sticky_reads += sticky
+        return self.primary
+
+    def session_factory(self, connection: HTTPConnection) -> sessionmaker:
+        if getattr(connection.scope.get("endpoint"), "reads_from_primary", False):
+            # Sessions are lazy: a cache hit never connects, only a miss reads the primary
+            self.primary_reads += 1
+            self.cache_fill_reads += 1
+            return self.primary
+        try:
+            sticky = float(connection.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+        except ValueError:
+            sticky = False
+        return self.choose(sticky)
+
+    @staticmethod
+    async def _ping(replica: Replica) -> None:
+        async with replica.engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    async def _check(self, replica: Replica) -> None:
+        try:
+            await asyncio.wait_for(self._ping(replica), self.check_timeout)
+        except (exc.SQLAlchemyError, OSError, asyncio.TimeoutError) as error:
+            if replica.healthy:
+                logger.warning("Read replica %s failed its health check, reading from the others", replica.name)
+            replica.healthy = False
+            replica.last_error = repr(error)
+            return
+        if not replica.healthy:
+            logger.info("Read replica %s is healthy again", replica.name)
+        replica.healthy = True
+
+    async def check(self) -> None:
+        await asyncio.gather(*[self._check(replica) for replica in self.replicas])
+
+    async def monitor(self) -> None:
+        # Started by main.lifespan when there are replicas, runs until the app stops
+        while True:
+            await self.check()
+            await asyncio.sleep(self.check_interval)
+
+    async def dispose(self) -> None:
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def stats(self) -> dict:
+        return {
+            "replicas": [replica.stats() for replica in self.replicas],
+            "primary_reads": self.primary_reads,
+            "sticky_reads": self.sticky_reads,
+            "cache_fill_reads": self.cache_fill_reads,
+        }
+
+
+class ReadYourWritesMiddleware:
+    """
+    After a successful request that may have written (any method but GET, HEAD
+    and OPTIONS), sets a cookie sending the client's reads to the primary for
+    `window` seconds, so it sees its own writes before the replicas catch up.
+    """
+
+    def __init__(self, app: ASGIApp, window: float):
+        self.app = app
+        self.window = window
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + self.window
+                MutableHeaders(scope=message).append(
+                    "Set-Cookie",
+                    f"{READ_YOUR_WRITES_COOKIE}={until:.3f}; Max-Age={int(self.window) + 1}; "
+                    f"Path=/; HttpOnly; SameSite=Lax")
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
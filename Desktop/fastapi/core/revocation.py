@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import redis.asyncio as redis
+
+from .bloom import BloomFilter
+
+logger = logging.getLogger(__name__)
+
+# Sorted set of revoked entries, scored by when they stop mattering (unix time)
+REVOKED_KEY = "auth:revoked"
+REVOCATION_CHANNEL = "auth:revoke"
+# How often each worker rebuilds its filter from Redis, shedding expired entries
+RELOAD_SECONDS = 300
+
+
+def token_entry(jti: str) -> str:
+    # One token
+    return f"jti:{jti}"
+
+
+def version_entry(username: str, version: int) -> str:
+    # Every token issued to the user with that token version
+    return f"ver:{username}:{version}"
+
+
+class RevocationList:
+    """
+    Revoked access tokens. Redis holds the list; every worker mirrors it in a
+    Bloom filter, so checking a token that isn't revoked (nearly all of them) is
+    an in-memory probe. Only a probable hit is confirmed against Redis, and if
+    Redis can't be reached then the token is treated as revoked.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.filter = BloomFilter(capacity, error_rate)
+        self.redis: Optional[redis.Redis] = None
+        self.checks = 0
+        self.probable = 0
+        self.confirmed = 0
+
+    def configure(self, redis_client: redis.Redis) -> None:
+        # Called from main.lifespan once the Redis client exists
+        self.redis = redis_client
+
+    async def revoke(self, entry: str, until: float) -> None:
+        """Revokes a token_entry or version_entry until `until` (unix time), after which it has expired anyway."""
+        await self.redis.zadd(REVOKED_KEY, {entry: until}, gt=True)
+        self.filter.add(entry)
+        await self.redis.publish(REVOCATION_CHANNEL, entry)
+
+    async def restore(self, entry: str) -> None:
+        """
+        Undoes revoke() for a change that didn't go through. The filters keep the
+        entry until their next reload, but Redis no longer confirms it.
+        """
+        try:
+            await self.redis.zrem(REVOKED_KEY, entry)
+        except redis.RedisError:
+            logger.warning("Could not take back the revocation of %s", entry, exc_info=True)
+
+    async def is_revoked(self, *entries: str) -> bool:
+        self.checks += 1
+        candidates = [entry for entry in entries if entry in self.filter]
+        if not candidates:
+            return False
+        self.probable += 1
+        if self.redis is None:
+            return True
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for entry in candidates:
+                    pipe.zscore(REVOKED_KEY, entry)
+                scores = await pipe.execute()
+        except redis.RedisError:
+            logger.warning("Could not confirm a token revocation, rejecting the token", exc_info=True)
+            return True
+        now = time.time()
+        revoked = any(score is not None and score > now for score in scores)
+        self.confirmed += revoked
+        return revoked
+
+    async def reload(self) -> None:
+        now = time.time()
+        await self.redis.zremrangebyscore(REVOKED_KEY, "-inf", now)
+        entries = await self.redis.zrangebyscore(REVOKED_KEY, now, "+inf")
+        # Grows past its capacity rather than let the error rate climb
+        bloom = BloomFilter(max(self.capacity, 2 * len(entries)), self.error_rate)
+        for entry in entries:
+            bloom.add(entry.decode())
+        self.filter = bloom
+
+    async def listen(self) -> None:
+        """
+        Mirrors revocations made by the other workers; runs for the lifetime of the
+        app (started in main.lifespan). The filter is rebuilt from Redis whenever
+        the subscription is (re)made and every RELOAD_SECONDS.
+        """
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(REVOCATION_CHANNEL)
+                    await self.reload()
+                    reload_at = time.monotonic() + RELOAD_SECONDS
+                    while True:
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                        if message is not None and message["type"] == "message":
+                            self.filter.add(message["data"].decode())
+                        if time.monotonic() >= reload_at:
+                            await self.reload()
+                            reload_at = time.monotonic() + RELOAD_SECONDS
+            except redis.RedisError:
+                logger.warning("Token revocation subscription lost, retrying", exc_info=True)
+                await asyncio.sleep(1)
+
+    def stats(self) -> dict:
+        return {
+            "added": self.filter.count,
+            "filter_bytes": len(self.filter.array),
+            "checks": self.checks,
+            "probable": self.probable,
+            "confirmed": self.confirmed,
+        }
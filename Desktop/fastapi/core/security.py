@@ -1,5 +1,12 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
 from passlib.context import CryptContext
 
+from .config import get_settings
+
 # Initialize CryptContext with bcrypt scheme
 # Use lazy initialization to avoid errors during import
 try:
@@ -9,8 +16,85 @@ except Exception:
     # This should not happen if bcrypt is properly installed
     raise ImportError("bcrypt is required. Install it with: pip install bcrypt")
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+class PasswordHasherBusy(Exception):
+    """Too many hashes are queued already; the caller should answer 503."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a small dedicated thread pool (bcrypt releases the GIL), so
+    a burst of logins doesn't block the event loop. At most `workers` hashes run
+    at once and `queue_limit` more may wait; beyond that run() raises
+    PasswordHasherBusy right away instead of queueing more work.
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        # False hashes on the event loop, as before (for benchmarks)
+        self.enabled = True
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _release(self) -> None:
+        self.pending -= 1
+
+    def _finished(self, wait: float, run: float) -> None:
+        self.completed += 1
+        self.wait_seconds += wait
+        self.run_seconds += run
+        self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if not self.enabled:
+            return fn(*args)
+        if self.pending >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise PasswordHasherBusy("Too many password checks in progress, try again shortly.")
+        loop = asyncio.get_running_loop()
+        queued_at = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                # Counted when the thread is done, even if the request was cancelled meanwhile
+                loop.call_soon_threadsafe(self._finished, started - queued_at, time.perf_counter() - started)
+
+        self.pending += 1
+        future = self.executor.submit(timed)
+        # Frees the slot however the job ends: a request cancelled while its hash
+        # is still queued cancels the job, and timed() never runs
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "running": min(self.pending, self.workers),
+            "queued": max(self.pending - self.workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_seconds * 1000 / self.completed, 3) if self.completed else None,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+            "avg_hash_ms": round(self.run_seconds * 1000 / self.completed, 3) if self.completed else None,
+        }
+
+
+hasher = PasswordHasher(workers=get_settings().PASSWORD_HASH_WORKERS, queue_limit=get_settings().PASSWORD_HASH_QUEUE)
+
+
+async def get_password_hash(password: str) -> str:
+    return await hasher.run(pwd_context.hash, password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await hasher.run(pwd_context.verify, plain_password, hashed_password)
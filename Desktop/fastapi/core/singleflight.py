@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+from functools import wraps
+from inspect import Parameter, signature
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+import redis.asyncio as redis
+from redis.asyncio.lock import Lock
+from redis.exceptions import LockError
+from starlette.requests import Request
+from starlette.responses import Response
+
+logger = logging.getLogger(__name__)
+
+# How often a worker waiting on another worker's lock checks whether it is gone
+LOCK_POLL_INTERVAL = 0.02
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one execution: the first caller (the
+    leader) runs it and the others await its outcome, result or exception.
+    This is per process; acquire_or_wait coordinates workers through Redis.
+    """
+
+    def __init__(self):
+        self.calls: Dict[str, asyncio.Future] = {}
+        self.enabled = True
+        self.leaders = 0
+        self.followers = 0
+        self.peer_waits = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Returns (result, shared). Followers get shared=True: the object is the
+        leader's, so they must copy it before changing it (see copy_result).
+        """
+        if not self.enabled:
+            return await fn(), False
+        while True:
+            future = self.calls.get(key)
+            if future is None:
+                break
+            self.followers += 1
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                # The leader was cancelled (its client went away). Unless this
+                # request was cancelled too, run it again with a new leader.
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+        future = asyncio.get_running_loop().create_future()
+        self.calls[key] = future
+        self.leaders += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # mark it retrieved, there may be no followers
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self.calls[key]
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self.calls),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "peer_waits": self.peer_waits,
+        }
+
+
+# One per process, shared by every route
+flights = SingleFlight()
+
+
+def request_key(request: Request) -> str:
+    """
+    What makes two requests identical for coalescing: method, path, the sorted query
+    string and If-None-Match (one of them may get a 304 where the other must not).
+    """
+    query = urlencode(sorted(request.query_params.multi_items()))
+    return f"{request.method} {request.url.path}?{query} {request.headers.get('if-none-match', '')}"
+
+
+def copy_result(result: Any) -> Any:
+    # Responses carry per-request state (headers, background tasks); anything
+    # else is only serialized, which can be done on a shared object
+    if isinstance(result, Response):
+        return Response(content=result.body, status_code=result.status_code, headers=dict(result.headers))
+    return result
+
+
+async def acquire_or_wait(redis_client: redis.Redis, name: str, timeout: float) -> Optional[Lock]:
+    """
+    Takes the short cross-worker lock `name` and returns it; the caller computes and
+    releases it. If another worker holds it, waits until that worker is done (at
+    most `timeout` seconds, the lock's own lifetime) and returns None.
+    """
+    lock = redis_client.lock(name, timeout=timeout)
+    if await lock.acquire(blocking=False):
+        return lock
+    flights.peer_waits += 1
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and await redis_client.exists(name):
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+    return None
+
+
+async def release(lock: Lock) -> None:
+    try:
+        await lock.release()
+    except LockError:
+        pass  # it expired first; whoever holds it now releases it
+    except redis.RedisError:
+        logger.warning("Could not release %s, it expires on its own", lock.name, exc_info=True)
+
+
+_REQUEST_PARAM = "__single_flight_request"
+
+
+def single_flight(func):
+    """
+    Route decorator: concurrent identical GETs in this process share one run of the
+    endpoint. Only for endpoints whose response doesn't depend on who is asking.
+    Cached routes get this from cache_tagged, which also coalesces across workers.
+    """
+    wrapped_signature = signature(func)
+    request_param = next(
+        (param.name for param in wrapped_signature.parameters.values() if param.annotation is Request), None)
+
+    @wraps(func)
+    async def inner(*args, **kwargs):
+        if request_param is None:
+            request = kwargs.pop(_REQUEST_PARAM)
+        else:
+            request = kwargs[request_param]
+        if request.method != "GET":
+            return await func(*args, **kwargs)
+        result, shared = await flights.do(request_key(request), lambda: func(*args, **kwargs))
+        return copy_result(result) if shared else result
+
+    if request_param is None:
+        # Have FastAPI inject the request, without passing it on to the endpoint
+        parameters = list(wrapped_signature.parameters.values())
+        position = next((i for i, param in enumerate(parameters) if param.kind is Parameter.VAR_KEYWORD), len(parameters))
+        parameters.insert(position, Parameter(_REQUEST_PARAM, Parameter.KEYWORD_ONLY, annotation=Request))
+        inner.__signature__ = wrapped_signature.replace(parameters=parameters)
+    return inner
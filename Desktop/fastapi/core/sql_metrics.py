@@ -0,0 +1,191 @@
+import bisect
+import logging
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import ORMExecuteState, Session, raiseload
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Slowest statements kept for /api/v1/metrics/sql, and how much of each
+SLOWEST_KEEP = 10
+STATEMENT_PREVIEW = 500
+
+
+class QueryStats:
+    """The statements run on behalf of one request."""
+
+    __slots__ = ("count", "seconds", "slowest", "slowest_statement", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = 0.0
+        self.slowest_statement: Optional[str] = None
+        self.statements: Counter = Counter()
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+        if seconds > self.slowest:
+            self.slowest = seconds
+            self.slowest_statement = statement
+
+    def server_timing(self) -> str:
+        return (f'db;dur={self.seconds * 1000:.2f};desc="{self.count} queries", '
+                f'db-slowest;dur={self.slowest * 1000:.2f}')
+
+
+class RouteStats:
+    __slots__ = ("requests", "queries", "seconds", "max_queries", "n_plus_one")
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.seconds = 0.0
+        self.max_queries = 0
+        self.n_plus_one = 0
+
+
+class SQLMetrics:
+    """Totals for this process, per route, and its slowest statements."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        # (seconds, statement), ascending
+        self.slowest: List[Tuple[float, str]] = []
+        self.routes: Dict[str, RouteStats] = defaultdict(RouteStats)
+
+    def record_query(self, statement: str, seconds: float) -> None:
+        self.queries += 1
+        self.seconds += seconds
+        if len(self.slowest) < SLOWEST_KEEP or seconds > self.slowest[0][0]:
+            bisect.insort(self.slowest, (seconds, statement[:STATEMENT_PREVIEW]))
+            if len(self.slowest) > SLOWEST_KEEP:
+                self.slowest.pop(0)
+
+    def record_request(self, route: str, stats: QueryStats, n_plus_one_threshold: int) -> None:
+        totals = self.routes[route]
+        totals.requests += 1
+        totals.queries += stats.count
+        totals.seconds += stats.seconds
+        totals.max_queries = max(totals.max_queries, stats.count)
+        if n_plus_one_threshold > 0 and stats.statements:
+            statement, repeats = stats.statements.most_common(1)[0]
+            if repeats >= n_plus_one_threshold:
+                totals.n_plus_one += 1
+                logger.warning("Possible N+1 on %s: the same statement ran %d times: %s",
+                               route, repeats, statement[:STATEMENT_PREVIEW])
+
+    def snapshot(self) -> dict:
+        return {
+            "queries": self.queries,
+            "db_ms": round(self.seconds * 1000, 3),
+            "routes": {
+                route: {
+                    "requests": totals.requests,
+                    "avg_queries": round(totals.queries / totals.requests, 2),
+                    "avg_db_ms": round(totals.seconds * 1000 / totals.requests, 3),
+                    "max_queries": totals.max_queries,
+                    "n_plus_one": totals.n_plus_one,
+                }
+                for route, totals in sorted(self.routes.items())
+            },
+            "slowest": [{"ms": round(seconds * 1000, 3), "statement": statement}
+                        for seconds, statement in reversed(self.slowest)],
+        }
+
+
+sql_metrics = SQLMetrics()
+
+_request_stats: ContextVar[Optional[QueryStats]] = ContextVar("sql_request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_start"].pop()
+    sql_metrics.record_query(statement, seconds)
+    # SQLAlchemy runs async sessions in greenlets that share the request's context
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.record(statement, seconds)
+
+
+def _handle_error(exception_context):
+    starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Times every statement; pass engine.sync_engine for an async engine."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def _raise_on_lazy_load(state: ORMExecuteState) -> None:
+    if state.is_relationship_load:
+        # With any do_orm_execute listener, selectin loads inherit the parent's
+        # yield_per, which many-to-one loads can't combine with their unique()
+        # (e.g. crud_product.stream_all_products); they read their rows in one go
+        if state.execution_options.get("yield_per"):
+            state.update_execution_options(yield_per=None)
+    elif state.is_select and not state.is_column_load:
+        # Relationship loads a query didn't ask for eagerly raise instead of emitting
+        # SQL; loads the identity map can answer without a query are still fine
+        state.statement = state.statement.options(raiseload("*", sql_only=True))
+
+
+def raise_on_lazy_loads() -> None:
+    """
+    Debug/test mode (Settings.SQL_RAISE_ON_LAZY_LOAD): accessing Product.reviews,
+    Review.user or any other relationship that wasn't eagerly loaded raises,
+    so an N+1 fails loudly instead of reaching production.
+    """
+    if not event.contains(Session, "do_orm_execute", _raise_on_lazy_load):
+        event.listen(Session, "do_orm_execute", _raise_on_lazy_load)
+
+
+class SQLTimingMiddleware:
+    """
+    Collects the statements each request runs: sent back as a Server-Timing header
+    (total database time and query count, and the slowest statement) and added
+    to sql_metrics under the route. Requests where one statement repeats
+    `n_plus_one_threshold` times are logged as a possible N+1.
+    """
+
+    def __init__(self, app: ASGIApp, n_plus_one_threshold: int = 10):
+        self.app = app
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = QueryStats()
+        token = _request_stats.set(stats)
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start" and stats.count:
+                MutableHeaders(scope=message).append("Server-Timing", stats.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stats.reset(token)
+            route = scope.get("route")
+            sql_metrics.record_request(f"{scope['method']} {route.path if route else 'unmatched'}",
+                                       stats, self.n_plus_one_threshold)
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import redis.asyncio as redis
+
+from schema import UserPublic
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "auth:user-invalidate"
+
+
+class UserCache:
+    """
+    Users resolved by core.auth.get_current_user, keyed by token subject, so an
+    authenticated request doesn't need a user query. Each worker keeps up to
+    `max_entries` in an LRU; with `shared` they are also kept in Redis for the
+    other workers. An entry is never served more than `ttl` seconds after it was
+    read from the database (0 turns the cache off); invalidate() drops it
+    everywhere right away.
+    """
+
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.redis: Optional[redis.Redis] = None
+        self.shared = False
+        # username -> (expires at on the monotonic clock, user)
+        self.entries: "OrderedDict[str, Tuple[float, UserPublic]]" = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def configure(self, redis_client: redis.Redis, shared: bool) -> None:
+        # Called from main.lifespan once the Redis client exists
+        self.redis = redis_client
+        self.shared = shared
+
+    @staticmethod
+    def redis_key(username: str) -> str:
+        return f"auth:user:{username}"
+
+    def _store(self, username: str, user: UserPublic, lifetime: float) -> None:
+        self.entries[username] = (time.monotonic() + lifetime, user)
+        self.entries.move_to_end(username)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get(self, username: str) -> Optional[UserPublic]:
+        if self.ttl <= 0:
+            return None
+        entry = self.entries.get(username)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.entries.move_to_end(username)
+                self.hits += 1
+                return entry[1]
+            del self.entries[username]
+        if self.shared and self.redis is not None:
+            try:
+                raw = await self.redis.get(self.redis_key(username))
+            except redis.RedisError:
+                logger.warning("Could not read the cached user %s", username, exc_info=True)
+                raw = None
+            if raw is not None:
+                cached = json.loads(raw)
+                # Counted from when it was read from the database, not from now
+                remaining = cached["t"] + self.ttl - time.time()
+                if remaining > 0:
+                    user = UserPublic.model_validate(cached["user"])
+                    self._store(username, user, remaining)
+                    self.shared_hits += 1
+                    return user
+        self.misses += 1
+        return None
+
+    async def put(self, username: str, user: UserPublic) -> None:
+        if self.ttl <= 0:
+            return
+        self._store(username, user, self.ttl)
+        if self.shared and self.redis is not None:
+            try:
+                await self.redis.set(self.redis_key(username),
+                                     json.dumps({"t": time.time(), "user": user.model_dump()}), ex=self.ttl)
+            except redis.RedisError:
+                logger.warning("Could not store the cached user %s", username, exc_info=True)
+
+    async def invalidate(self, username: str) -> None:
+        """Call after committing a change to the user (role, deletion, ...)."""
+        self.entries.pop(username, None)
+        self.invalidations += 1
+        if self.redis is None:
+            return
+        try:
+            if self.shared:
+                await self.redis.delete(self.redis_key(username))
+            await self.redis.publish(INVALIDATION_CHANNEL, username)
+        except redis.RedisError:
+            # The other workers still drop it within ttl
+            logger.warning("Could not broadcast the invalidation of user %s", username, exc_info=True)
+
+    async def listen(self) -> None:
+        """
+        Applies invalidations published by the other workers; runs for the lifetime
+        of the app (started in main.lifespan). Whenever the subscription is (re)made
+        the local entries are dropped, since messages sent in between are lost.
+        """
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    self.entries.clear()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.entries.pop(message["data"].decode(), None)
+                            self.invalidations += 1
+            except redis.RedisError:
+                logger.warning("User invalidation subscription lost, retrying", exc_info=True)
+                self.entries.clear()
+                await asyncio.sleep(1)
+
+    def stats(self) -> dict:
+        return {
+            "ttl": self.ttl,
+            "shared": self.shared,
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
@@ -1,15 +1,17 @@
 from typing import List
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel import select
+from sqlalchemy import insert
 from model.models import Category
 from schema import CategoryCreate
+from core.cache import mark_stale
 
 async def create_category(category_data: CategoryCreate, session: AsyncSession) -> Category:
-    db_category = Category.model_validate(category_data)
-    session.add(db_category)
-    await session.commit()
-    await session.refresh(db_category)
-    return db_category
+    # INSERT ... RETURNING builds the object in one round-trip; the caller commits
+    statement = insert(Category).values(**category_data.model_dump()).returning(Category)
+    result = await session.exec(statement)
+    mark_stale(session, "categories")
+    return result.scalar_one()
 
 async def get_all_category(session: AsyncSession) -> List[Category]:
     statement = select(Category)
@@ -0,0 +1,65 @@
+from typing import Dict, List, Optional, Tuple
+import redis.asyncio as redis
+from model.models import Product
+
+BOARDS = ("top_rated", "most_reviewed")
+
+# top_rated ranks by a Bayesian average: every product starts with PRIOR_WEIGHT
+# imaginary reviews of PRIOR_RATING, so one 5-star review doesn't beat a
+# hundred 4.8 ones.
+PRIOR_RATING = 3.0
+PRIOR_WEIGHT = 5
+
+
+def leaderboard_key(board: str, category_id: Optional[int] = None) -> str:
+    scope = "global" if category_id is None else f"category:{category_id}"
+    return f"leaderboard:{board}:{scope}"
+
+
+def board_scores(review_count: int, rating_sum: int) -> Dict[str, float]:
+    return {
+        "top_rated": (PRIOR_RATING * PRIOR_WEIGHT + rating_sum) / (PRIOR_WEIGHT + review_count),
+        "most_reviewed": float(review_count),
+    }
+
+
+# product id -> review_count its board entries were computed from, see record_product
+VERSIONS_KEY = "leaderboard:versions"
+
+# KEYS: VERSIONS_KEY, then the boards. ARGV: product id, review_count, then one
+# score per board. Skips the write when a newer review_count was recorded already.
+_RECORD_SCRIPT = """
+local recorded = redis.call('HGET', KEYS[1], ARGV[1])
+if recorded and tonumber(recorded) > tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+for i = 2, #KEYS do
+    redis.call('ZADD', KEYS[i], ARGV[i + 1], ARGV[1])
+end
+return 1
+"""
+
+
+async def record_product(redis_client: redis.Redis, product: Product) -> bool:
+    """
+    Writes a product's current scores to the global and category boards.
+    Every review bumps review_count, so it orders the snapshots: a write computed
+    from an older count than the one already recorded (two reviews whose updates
+    arrive out of order) is dropped. Returns whether the boards were written.
+    """
+    keys = [VERSIONS_KEY]
+    scores = []
+    for board, score in board_scores(product.review_count, product.rating_sum).items():
+        keys += [leaderboard_key(board), leaderboard_key(board, product.category_id)]
+        scores += [score, score]
+    written = await redis_client.eval(_RECORD_SCRIPT, len(keys), *keys, product.id, product.review_count, *scores)
+    return bool(written)
+
+
+async def get_leaderboard(
+    redis_client: redis.Redis, board: str, category_id: Optional[int] = None, limit: int = 10
+) -> List[Tuple[int, float]]:
+    """Returns [(product_id, score)], best first."""
+    entries = await redis_client.zrevrange(leaderboard_key(board, category_id), 0, limit - 1, withscores=True)
+    return [(int(member), score) for member, score in entries]
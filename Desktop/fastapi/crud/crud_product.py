@@ -1,40 +1,355 @@
-from typing import List
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+import asyncpg
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
-from model.models import Product
+from model.models import Category, Product, ProductEmbedding, Review
 from schema import ProductCreate
+from sqlalchemy import and_, case, column, func, insert, literal_column, or_, table, true, tuple_
+from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from core.pagination import decode_cursor, encode_cursor, keyset_filter, keyset_order, next_cursor
+from crud.crud_review import get_recent_reviews_for_products
+from core.cache import mark_stale
+from core.embeddings import load_embedding_matrix, top_k_similar
+from starlette.concurrency import run_in_threadpool
+
+# How many of the newest reviews a product response embeds by default.
+# Older reviews are reached through the paginated reviews endpoint.
+EMBEDDED_REVIEWS_LIMIT = 10
+
+# Lower bounds of the price facet buckets; the last bucket is open-ended.
+PRICE_BUCKET_BOUNDS = [0, 25, 50, 100, 250, 500, 1000]
+
+# Sort orders supported by keyset pagination. Each one is paired with Product.id
+# as a tiebreaker so that the order is total and pages never overlap.
+PRODUCT_SORTS = {
+    "id": Product.id,
+    "name": Product.name,
+    "price": Product.price,
+}
 
 
 async def create_product(product_data: ProductCreate, session: AsyncSession) -> Product:
-    db_product = Product.model_validate(product_data)
-    session.add(db_product)
-    await session.commit()
-    await session.refresh(db_product)
-    exec_query = select(Product).where(Product.id == db_product.id).options(selectinload(Product.reviews)).options(selectinload(Product.category))
+    # INSERT ... RETURNING builds the object, the category comes with it; the caller commits
+    exec_query = (
+        insert(Product)
+        .values(**product_data.model_dump())
+        .returning(Product)
+        .options(selectinload(Product.category))
+    )
     egar_load = await session.exec(exec_query)
-    return egar_load.one()
+    product = egar_load.scalar_one()
+    # A new product has no reviews yet, no need to query for them.
+    set_committed_value(product, "reviews", [])
+    mark_stale(session, "catalog", f"category:{product.category_id}")
+    return product
+
+def _category_filter(category_id: Optional[int]):
+    return Product.category_id == category_id if category_id is not None else true()
+
+def _price_filter(price_min: Optional[float], price_max: Optional[float]):
+    conditions = []
+    if price_min is not None:
+        conditions.append(Product.price >= price_min)
+    if price_max is not None:
+        conditions.append(Product.price <= price_max)
+    return and_(true(), *conditions)
+
+def _rating_filter(min_rating: Optional[float]):
+    if min_rating is None:
+        return true()
+    # average >= min_rating, written without a division so it reads the stored aggregates as-is
+    return and_(Product.review_count > 0, Product.rating_sum >= min_rating * Product.review_count)
+
+BULK_INSERT_COLUMNS = ["name", "description", "price", "category_id"]
+
+async def get_category_ids(session: AsyncSession) -> Set[int]:
+    result = await session.exec(select(Category.id))
+    return set(result.all())
+
+async def bulk_insert_products(rows: List[dict], session: AsyncSession) -> int:
+    """
+    Inserts already-validated product rows in one transaction, without the
+    refresh/reload round-trips of create_product. Uses COPY on asyncpg and a
+    single executemany everywhere else.
+    """
+    if not rows:
+        return 0
+    mark_stale(session, "catalog", *{f"category:{row['category_id']}" for row in rows})
+    connection = await session.connection()
+    if connection.dialect.driver == "asyncpg":
+        raw = await connection.get_raw_connection()
+        try:
+            await raw.driver_connection.copy_records_to_table(
+                Product.__tablename__,
+                records=[tuple(row[name] for name in BULK_INSERT_COLUMNS) for row in rows],
+                columns=BULK_INSERT_COLUMNS,
+            )
+        except asyncpg.IntegrityConstraintViolationError as exc:
+            # COPY goes around SQLAlchemy, so its errors arrive unwrapped; raise
+            # what the executemany path would, for callers to handle both alike
+            raise IntegrityError("COPY product", None, exc) from exc
+        except asyncpg.DataError as exc:
+            raise DataError("COPY product", None, exc) from exc
+    else:
+        await session.exec(insert(Product), params=rows)
+    await session.commit()
+    return len(rows)
 
-async def get_all_products(session: AsyncSession) -> List[Product]:
-    statement = select(Product).options(selectinload(Product.reviews)).options(selectinload(Product.category))
+async def get_all_products(
+    session: AsyncSession,
+    category_id: Optional[int] = None,
+    price_min: Optional[float] = None,
+    price_max: Optional[float] = None,
+    min_rating: Optional[float] = None,
+    sort: str = "id",
+    descending: bool = False,
+) -> List[Product]:
+    sort_column = PRODUCT_SORTS[sort]
+    statement = (
+        select(Product)
+        .where(_category_filter(category_id), _price_filter(price_min, price_max), _rating_filter(min_rating))
+        .options(selectinload(Product.category))
+        .order_by(*keyset_order(sort_column, Product.id, descending))
+    )
     result = await session.exec(statement)
     return result.all()
 
+async def get_product_facets(
+    session: AsyncSession,
+    category_id: Optional[int] = None,
+    price_min: Optional[float] = None,
+    price_max: Optional[float] = None,
+    min_rating: Optional[float] = None,
+) -> dict:
+    """
+    Counts products per category and per price bucket in a single grouped query.
+    Each facet ignores its own filter (the category counts are not narrowed to the
+    selected category, the price buckets not to the selected range) so clients can
+    show the alternatives; every other filter applies to both.
+    """
+    bucket = case(
+        *[(Product.price < upper, lower) for lower, upper in zip(PRICE_BUCKET_BOUNDS, PRICE_BUCKET_BOUNDS[1:])],
+        else_=PRICE_BUCKET_BOUNDS[-1],
+    ).label("bucket")
+    statement = (
+        select(
+            Category.id,
+            Category.name,
+            bucket,
+            func.sum(case((_price_filter(price_min, price_max), 1), else_=0)),
+            func.sum(case((_category_filter(category_id), 1), else_=0)),
+        )
+        .select_from(Product)
+        .join(Category, Category.id == Product.category_id)
+        .where(_rating_filter(min_rating))
+        .group_by(Category.id, Category.name, bucket)
+    )
+    rows = (await session.exec(statement)).all()
+
+    categories: Dict[int, dict] = {}
+    buckets = {lower: 0 for lower in PRICE_BUCKET_BOUNDS}
+    for cat_id, cat_name, lower, in_price_range, in_category in rows:
+        facet = categories.setdefault(cat_id, {"category_id": cat_id, "name": cat_name, "count": 0})
+        facet["count"] += in_price_range
+        buckets[lower] += in_category
+    upper_bounds = PRICE_BUCKET_BOUNDS[1:] + [None]
+    return {
+        "categories": sorted(categories.values(), key=lambda facet: facet["category_id"]),
+        "price_buckets": [
+            {"min": lower, "max": upper, "count": buckets[lower]}
+            for lower, upper in zip(PRICE_BUCKET_BOUNDS, upper_bounds)
+        ],
+    }
+
+async def attach_recent_reviews(
+    products: List[Product], session: AsyncSession, limit: int = EMBEDDED_REVIEWS_LIMIT
+) -> Dict[int, Optional[str]]:
+    """
+    Loads at most `limit` of the newest reviews into each product's `reviews`
+    (one query for all of them) and returns, per product id, the cursor for
+    the rest of its reviews or None if they all fit.
+    """
+    recent = await get_recent_reviews_for_products([product.id for product in products], session, limit)
+    for product in products:
+        reviews, _ = recent[product.id]
+        set_committed_value(product, "reviews", reviews)
+    return {product_id: cursor for product_id, (_, cursor) in recent.items()}
+
+async def stream_all_products(session: AsyncSession, batch_size: int = 500) -> AsyncIterator[Product]:
+    """
+    Yields every product without loading the whole catalog at once.
+    Rows come from a server-side cursor in batches of batch_size, and the
+    reviews/categories of each batch are selectin-loaded per batch.
+    """
+    statement = (
+        select(Product)
+        .options(selectinload(Product.reviews).selectinload(Review.user))
+        .options(selectinload(Product.category))
+        .order_by(Product.id)
+        .execution_options(yield_per=batch_size)
+    )
+    result = await session.stream_scalars(statement)
+    async for product in result:
+        yield product
+
 async def get_product_by_id(product_id: int, session: AsyncSession) -> Product:
-    statement = select(Product).where(Product.id == product_id).options(selectinload(Product.reviews)).options(selectinload(Product.category))
+    statement = select(Product).where(Product.id == product_id).options(selectinload(Product.category))
     result = await session.exec(statement)
     return result.one_or_none()    
 
+async def get_products_by_ids(product_ids: List[int], session: AsyncSession) -> Dict[int, Product]:
+    statement = select(Product).where(Product.id.in_(product_ids)).options(selectinload(Product.category))
+    result = await session.exec(statement)
+    return {product.id: product for product in result.all()}
+
 async def get_all_products_paginated(skip: int, limit: int, session: AsyncSession) -> List[Product]:
     """
     Retrieves a paginated list of all products from the database.
     """
     statement = (
         select(Product)
-        .options(selectinload(Product.reviews))
         .options(selectinload(Product.category))
+        .order_by(Product.id)
         .offset(skip)
         .limit(limit)
     )
     result = await session.exec(statement)
     return result.all()
+
+async def get_products_keyset(
+    session: AsyncSession,
+    limit: int,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    descending: bool = False,
+) -> Tuple[List[Product], Optional[str]]:
+    """
+    Retrieves one page of products ordered by (sort, id), starting after the cursor.
+    Unlike OFFSET, the cost of a page does not grow with how deep it is.
+    Returns the page and the cursor for the next page (None when exhausted).
+    """
+    sort_column = PRODUCT_SORTS[sort]
+    sort_key = f"{sort}:{'desc' if descending else 'asc'}"
+    statement = (
+        select(Product)
+        .options(selectinload(Product.category))
+        .order_by(*keyset_order(sort_column, Product.id, descending))
+        .limit(limit + 1)
+    )
+    if cursor:
+        key, row_id = decode_cursor(cursor, sort_key)
+        statement = statement.where(keyset_filter(sort_column, Product.id, key, row_id, descending))
+    result = await session.exec(statement)
+    return next_cursor(list(result.all()), limit, sort_key, sort)
+
+SEARCH_CURSOR_SORT = "rank"
+
+def _fts5_match_expression(q: str) -> str:
+    # Quote every term so user input can't inject FTS5 syntax; the trailing *
+    # turns each term into a prefix match ("lapt" finds "laptop").
+    terms = [term.replace('"', "") for term in q.split()]
+    return " ".join(f'"{term}"*' for term in terms if term)
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+async def search_products(
+    q: str,
+    session: AsyncSession,
+    limit: int,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Product], Optional[str]]:
+    """
+    Full-text search over product name and description, best matches first.
+    On Postgres this ranks with the GIN-indexed search_vector column plus pg_trgm
+    similarity on the name (so typos still match); on SQLite it uses the
+    product_fts FTS5 table, and elsewhere a substring match. Returns the page
+    and the cursor for the next page.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        search_vector = literal_column("product.search_vector")
+        ts_query = func.websearch_to_tsquery(literal_column("'english'::regconfig"), q)
+        rank = (func.ts_rank_cd(search_vector, ts_query) + func.similarity(Product.name, q)).label("rank")
+        statement = select(Product, rank).where(or_(search_vector.op("@@")(ts_query), Product.name.op("%")(q)))
+    elif dialect == "sqlite":
+        match = _fts5_match_expression(q)
+        if not match:
+            return [], None
+        fts = literal_column("product_fts")
+        # bm25() is lower-is-better, negate it so both backends sort rank descending
+        rank = (-func.bm25(fts)).label("rank")
+        statement = (
+            select(Product, rank)
+            .join(table("product_fts", column("rowid")), literal_column("product_fts.rowid") == Product.id)
+            .where(fts.op("MATCH")(match))
+        )
+    else:
+        # No full-text index on this backend: every term must appear in the name
+        # or description, and products with more of them in the name rank first
+        patterns = [_like_pattern(term) for term in q.split()]
+        if not patterns:
+            return [], None
+        rank = sum(case((Product.name.ilike(pattern, escape="\\"), 1), else_=0) for pattern in patterns).label("rank")
+        statement = select(Product, rank).where(*[
+            or_(Product.name.ilike(pattern, escape="\\"), Product.description.ilike(pattern, escape="\\"))
+            for pattern in patterns
+        ])
+
+    statement = (
+        statement
+        .options(selectinload(Product.category))
+        .order_by(rank.desc(), Product.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        last_rank, last_id = decode_cursor(cursor, SEARCH_CURSOR_SORT)
+        statement = statement.where(tuple_(rank, Product.id) < tuple_(last_rank, last_id))
+    rows = (await session.exec(statement)).all()
+    if len(rows) <= limit:
+        return [product for product, _ in rows], None
+    page = rows[:limit]
+    last_product, last_rank = page[-1]
+    return [product for product, _ in page], encode_cursor(SEARCH_CURSOR_SORT, last_rank, last_product.id)
+
+async def get_similar_products(
+    product_id: int, session: AsyncSession, limit: int, embeddings_path: str
+) -> List[Tuple[Product, float]]:
+    """
+    Nearest neighbours of a product by embedding cosine similarity, best first.
+    On Postgres this is an ANN query on the HNSW-indexed product_embedding table;
+    without pgvector it is a brute-force NumPy top-k over the memory-mapped matrix
+    written by tasks.embed_products. Empty if embeddings were not built yet.
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        target = (await session.exec(
+            select(ProductEmbedding.embedding).where(ProductEmbedding.product_id == product_id)
+        )).one_or_none()
+        if target is None:
+            return []
+        # ORDER BY the distance to a literal vector, which is what lets pgvector use the index
+        distance = ProductEmbedding.embedding.cosine_distance(target)
+        statement = (
+            select(Product, distance)
+            .join(ProductEmbedding, ProductEmbedding.product_id == Product.id)
+            .where(Product.id != product_id)
+            .options(selectinload(Product.category))
+            .order_by(distance)
+            .limit(limit)
+        )
+        rows = (await session.exec(statement)).all()
+        return [(product, 1 - distance) for product, distance in rows]
+
+    loaded = load_embedding_matrix(embeddings_path)
+    if loaded is None:
+        return []
+    # A full scan of a large matrix takes a while; keep it off the event loop
+    neighbours = await run_in_threadpool(top_k_similar, *loaded, product_id, limit)
+    if not neighbours:
+        return []
+    products = await get_products_by_ids([neighbour_id for neighbour_id, _ in neighbours], session)
+    return [(products[neighbour_id], score) for neighbour_id, score in neighbours if neighbour_id in products]
+
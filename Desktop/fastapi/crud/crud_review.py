@@ -1,22 +1,113 @@
-from typing import List
+from typing import Dict, List, Optional, Tuple
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
-from model.models import Review
+from sqlalchemy import func, insert, update
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from model.models import Product, Review
 from schema import ReviewCreate
+from core.cache import mark_stale
+from core.pagination import decode_cursor, keyset_filter, keyset_order, next_cursor
 
+# Reviews are always paged newest first; cursors carry the last review id seen.
+REVIEW_CURSOR_SORT = "id:desc"
+# Products per query in get_recent_reviews_for_products
+RECENT_REVIEWS_BATCH = 500
 
-async def create_review(review_data: ReviewCreate, user_id: int, session: AsyncSession) -> Review:
-    review_dict = review_data.model_dump()
-    db_review = Review.model_validate(**review_dict, user_id=user_id)
-    session.add(db_review)
-    await session.commit()
-    await session.refresh(db_review)
+
+async def create_review(review_data: ReviewCreate, user_id: int, session: AsyncSession) -> Optional[Review]:
+    """
+    Inserts a review and bumps its product's aggregates in the caller's transaction.
+    The updated product is attached as review.product.
+    Returns None, without inserting, if the product does not exist.
+    """
+    # The UPDATE is relative (col = col + 1) so concurrent reviews don't lose counts,
+    # and the row it returns doubles as the product existence check.
+    rating_column = f"rating_{review_data.rating}"
+    bumped = await session.exec(
+        update(Product)
+        .where(Product.id == review_data.product_id)
+        .values(
+            review_count=Product.review_count + 1,
+            rating_sum=Product.rating_sum + review_data.rating,
+            **{rating_column: getattr(Product, rating_column) + 1},
+        )
+        .returning(Product)
+    )
+    product = bumped.scalar_one_or_none()
+    if product is None:
+        return None
+    statement = (
+        insert(Review)
+        .values(**review_data.model_dump(include={"text", "rating", "product_id"}), user_id=user_id)
+        .returning(Review)
+        .options(selectinload(Review.user))
+    )
+    result = await session.exec(statement)
+    db_review = result.scalar_one()
+    set_committed_value(db_review, "product", product)
+    # The product's aggregates and embedded reviews changed, and so did every listing it is in
+    mark_stale(session, f"product:{product.id}", f"category:{product.category_id}", "catalog")
     return db_review
 
-async def get_reviews_for_product(product_id: int, session: AsyncSession) -> List[Review]:
+async def get_reviews_for_product(
+    product_id: int,
+    session: AsyncSession,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Review], Optional[str]]:
     """
-    Retrieves all reviews for a specific product.
+    Retrieves one page of reviews for a specific product, newest first.
+    Seeks on the (product_id, id) index, so every page costs the same.
     """
-    statement = select(Review).where(Review.product_id == product_id)
+    statement = (
+        select(Review)
+        .where(Review.product_id == product_id)
+        .options(selectinload(Review.user))
+        .order_by(*keyset_order(Review.id, Review.id, descending=True))
+        .limit(limit + 1)
+    )
+    if cursor:
+        _, review_id = decode_cursor(cursor, REVIEW_CURSOR_SORT)
+        statement = statement.where(keyset_filter(Review.id, Review.id, review_id, review_id, descending=True))
     result = await session.exec(statement)
-    return result.all()   
\ No newline at end of file
+    return next_cursor(list(result.all()), limit, REVIEW_CURSOR_SORT, "id")
+
+async def get_recent_reviews_for_products(
+    product_ids: List[int], session: AsyncSession, limit: int
+) -> Dict[int, Tuple[List[Review], Optional[str]]]:
+    """
+    Retrieves the `limit` newest reviews of each product, one query per
+    RECENT_REVIEWS_BATCH products, together with the cursor that continues each
+    product's reviews on the paginated endpoint.
+    """
+    if not product_ids or limit <= 0:
+        return {product_id: ([], None) for product_id in product_ids}
+    grouped: Dict[int, List[Review]] = {product_id: [] for product_id in product_ids}
+    # Batches keep the IN list under the driver's bind parameter limit and each
+    # window query small, however many products the caller passes
+    for start in range(0, len(product_ids), RECENT_REVIEWS_BATCH):
+        batch = product_ids[start:start + RECENT_REVIEWS_BATCH]
+        # Rank reviews per product and keep one more than needed to know if there are more.
+        ranked = (
+            select(
+                Review.id,
+                func.row_number().over(partition_by=Review.product_id, order_by=Review.id.desc()).label("position"),
+            )
+            .where(Review.product_id.in_(batch))
+            .subquery()
+        )
+        statement = (
+            select(Review)
+            .join(ranked, Review.id == ranked.c.id)
+            .where(ranked.c.position <= limit + 1)
+            .options(selectinload(Review.user))
+            .order_by(Review.product_id, Review.id.desc())
+        )
+        result = await session.exec(statement)
+        for review in result.all():
+            grouped[review.product_id].append(review)
+    return {
+        product_id: next_cursor(reviews, limit, REVIEW_CURSOR_SORT, "id")
+        for product_id, reviews in grouped.items()
+    }
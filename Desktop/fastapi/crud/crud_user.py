@@ -1,18 +1,18 @@
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import insert, update
 from model.models import User
 from schema import UserCreate
 from core.security import get_password_hash
 
 async def create_user(user_data: UserCreate, session: AsyncSession) -> User:
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash(user_data.password)
     # create password excluding plain password
     user_dict = user_data.model_dump(exclude={"password"})
-    db_user = User(**user_dict, password=hashed_password)
-    session.add(db_user)
-    await session.commit()
-    await session.refresh(db_user)
-    return db_user
+    # INSERT ... RETURNING builds the object in one round-trip; the caller commits
+    statement = insert(User).values(**user_dict, password=hashed_password).returning(User)
+    result = await session.exec(statement)
+    return result.scalar_one()
 
 async def get_user_by_id(user_id: int, session: AsyncSession) -> User | None:
     statement = select(User).where(User.id == user_id)
@@ -25,3 +25,13 @@ async def get_user_by_username(username: str, session: AsyncSession) -> User | N
     return result.one_or_none()
 
 
+
+async def update_user_role(user_id: int, role: str, session: AsyncSession) -> User | None:
+    # A new token version: tokens carrying the old role must be revoked by the caller
+    statement = (
+        update(User).where(User.id == user_id)
+        .values(role=role, token_version=User.token_version + 1)
+        .returning(User)
+    )
+    result = await session.exec(statement)
+    return result.scalar_one_or_none()
@@ -0,0 +1,101 @@
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# Offline city -> coordinates lookup, so the weather proxy doesn't need a
+# geocoding call. The index is three .npy files written by scripts.build_gazetteer
+# from geodata/cities.tsv:
+#   <path>.names.npy   every normalized name and alias, sorted (fixed-width bytes)
+#   <path>.coords.npy  the matching (latitude, longitude) rows, float32
+#   <path>.prefix.npy  257 offsets: names starting with byte b are rows prefix[b]:prefix[b + 1]
+# Names and coordinates are memory-mapped, so a large gazetteer costs no startup
+# time and is shared between worker processes through the page cache.
+
+BUNDLED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "geodata", "cities")
+
+# Coordinates are rounded to this many decimals (about 1 km) before they are used,
+# so a city, its aliases and anything else that close share one cache entry
+COORDINATE_DECIMALS = 2
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+# Letters NFKD doesn't decompose into an ASCII base letter
+_FOLD = str.maketrans({"ł": "l", "ø": "o", "đ": "d", "ð": "d", "þ": "th", "æ": "ae", "œ": "oe", "ı": "i"})
+
+
+def normalize_name(name: str) -> str:
+    """
+    Lower case, accents and punctuation dropped, single spaces:
+    "  São  Paulo" -> "sao paulo", "St. Petersburg" -> "st petersburg".
+    """
+    folded = unicodedata.normalize("NFKD", name.casefold().translate(_FOLD))
+    return " ".join(_WORD_RE.findall(folded.encode("ascii", "ignore").decode()))
+
+
+class Place(NamedTuple):
+    latitude: float
+    longitude: float
+
+    @property
+    def key(self) -> str:
+        return f"{self.latitude:.{COORDINATE_DECIMALS}f},{self.longitude:.{COORDINATE_DECIMALS}f}"
+
+    @classmethod
+    def from_key(cls, key: str) -> "Place":
+        latitude, longitude = key.split(",")
+        return cls(float(latitude), float(longitude))
+
+
+class Gazetteer:
+    def __init__(self, names: np.ndarray, coords: np.ndarray, prefix: List[int]):
+        self.names = names
+        self.coords = coords
+        self.prefix = prefix
+
+    @classmethod
+    def load(cls, path: str) -> "Gazetteer":
+        # Plain ndarray views of the maps: np.memmap adds microseconds to every slice
+        return cls(
+            np.asarray(np.load(f"{path}.names.npy", mmap_mode="r")),
+            np.asarray(np.load(f"{path}.coords.npy", mmap_mode="r")),
+            np.load(f"{path}.prefix.npy").tolist(),
+        )
+
+    def resolve(self, name: str) -> Optional[Place]:
+        """The rounded coordinates of a city name or alias, or None if it's unknown."""
+        key = normalize_name(name).encode()
+        if not key or len(key) > self.names.dtype.itemsize:
+            return None
+        start, end = self.prefix[key[0]], self.prefix[key[0] + 1]
+        row = start + int(self.names[start:end].searchsorted(key))
+        if row >= end or self.names[row] != key:
+            return None
+        latitude, longitude = self.coords[row].tolist()
+        return Place(round(latitude, COORDINATE_DECIMALS), round(longitude, COORDINATE_DECIMALS))
+
+
+def build_index(entries: List[Tuple[str, float, float]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (names, coords, prefix) arrays for Gazetteer from (name, latitude, longitude)
+    entries. Names are normalized; the first entry for a name wins.
+    """
+    rows = {}
+    for name, latitude, longitude in entries:
+        key = normalize_name(name)
+        if key and key not in rows:
+            rows[key] = (latitude, longitude)
+    keys = sorted(rows)
+    width = max((len(key) for key in keys), default=1)
+    names = np.array([key.encode() for key in keys], dtype=f"S{width}")
+    coords = np.array([rows[key] for key in keys], dtype=np.float32).reshape(-1, 2)
+    first_bytes = np.array([key.encode()[0] for key in keys], dtype=np.int64)
+    prefix = np.searchsorted(first_bytes, np.arange(257), side="left").astype(np.int64)
+    return names, coords, prefix
+
+
+@lru_cache()
+def get_gazetteer(path: str) -> Gazetteer:
+    return Gazetteer.load(path)
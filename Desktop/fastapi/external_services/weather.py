@@ -1,17 +1,36 @@
-from fastapi import Depends
-from core.httpx_client import get_httpx_client
-from core.config import get_settings, Settings
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, NamedTuple, Optional, Set, Union
+
+from core.circuit_breaker import CircuitBreaker
+from core.config import Settings
+from external_services.gazetteer import BUNDLED_PATH, Place, get_gazetteer
 import httpx
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+class WeatherUnavailable(Exception):
+    """The upstream failed and there is no earlier reading to fall back on."""
+
+
+class UnknownCity(WeatherUnavailable):
+    """The city isn't in the gazetteer."""
+
 
-async def fetch_weather_data(
-    city_name: str, 
-    settings: Settings = Depends(get_settings),
-    client: httpx.AsyncClient = Depends(get_httpx_client)
-    ) -> dict:
-    BaseURL = "https://api.open-meteo.com/v1/forecast"
+def resolve_city(city_name: str, settings: Settings) -> Place:
+    place = get_gazetteer(settings.GAZETTEER_PATH or BUNDLED_PATH).resolve(city_name)
+    if place is None:
+        raise UnknownCity(f"Unknown city '{city_name}'.")
+    return place
+
+
+async def fetch_forecast(place: Place, settings: Settings, client: httpx.AsyncClient) -> dict:
     params = {
-        "latitude": 52.52,
-        "longitude": 13.419,
+        "latitude": place.latitude,
+        "longitude": place.longitude,
         "current_weather": True,
     }
     headers = {
@@ -19,7 +38,250 @@ async def fetch_weather_data(
         "User-Agent": "FastAPI-Weather-App1.0",
     }
 
-    response = await client.get(BaseURL, params=params, headers=headers)
+    response = await client.get(settings.WEATHER_BASE_URL, params=params, headers=headers)
     response.raise_for_status()
-    return response.json()
+    try:
+        return response.json()
+    except ValueError as exc:
+        raise httpx.DecodingError("The weather upstream answered with a body that isn't JSON.",
+                                  request=response.request) from exc
+
+
+# --- Stale-while-revalidate proxy ---------------------------------------------
+# Readings are kept in Redis as {"t": fetched at (unix time), "data": upstream JSON}
+# under weather:<latitude>,<longitude>, the rounded coordinates of the city (see
+# external_services.gazetteer), so its aliases share the entry. How old a reading may get before it is refreshed in the
+# background, refetched, or only used as a fallback is set in Settings.WEATHER_*.
+
+POPULARITY_KEY = "weather:popular-places"
+# Places tracked in the popularity ranking; the prewarmer trims the rest
+POPULARITY_KEEP = 1000
+PREWARM_LOCK_KEY = "weather:prewarm"
+
+# Consecutive upstream failures (timeouts, transport errors, 5xx) that open the
+# circuit, and how long it then stays open before one trial call
+BREAKER_FAILURES = 5
+BREAKER_RESET_SECONDS = 30
+
+breaker = CircuitBreaker(failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_SECONDS)
+
+# Most cities one batch request may ask for, and how many upstream calls it runs at once
+WEATHER_BATCH_MAX = 50
+WEATHER_BATCH_CONCURRENCY = 8
+
+# Places being refreshed in the background by this process
+_refreshing: Set[str] = set()
+_background_tasks: Set[asyncio.Task] = set()
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class WeatherReading(NamedTuple):
+    data: dict
+    # fresh, stale (served while being refreshed), miss (fetched now) or fallback (upstream failed)
+    status: str
+    age: int
+
+
+def weather_key(place: Place) -> str:
+    return f"weather:{place.key}"
+
+
+async def refresh_weather(place: Place, settings: Settings, client: httpx.AsyncClient, redis_client: redis.Redis) -> dict:
+    """
+    Calls the upstream within its latency budget, through the circuit breaker,
+    and stores the reading.
+    """
+    if not breaker.allow():
+        raise CircuitOpen("Weather upstream circuit is open.")
+    try:
+        data = await asyncio.wait_for(fetch_forecast(place, settings, client), settings.WEATHER_UPSTREAM_TIMEOUT)
+    except httpx.HTTPStatusError as exc:
+        if exc.response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()  # it answered; the request was bad
+        raise
+    except (asyncio.TimeoutError, httpx.HTTPError):
+        breaker.record_failure()
+        raise
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    except Exception:
+        # Anything unexpected still ends a half-open trial, or the circuit would never close
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    try:
+        await redis_client.set(weather_key(place), json.dumps({"t": time.time(), "data": data}),
+                               ex=settings.WEATHER_KEEP_LAST_GOOD)
+    except redis.RedisError:
+        logger.warning("Could not store the weather for %s", place.key, exc_info=True)
+    return data
+
+
+async def _refresh_in_background(place: Place, settings: Settings, client: httpx.AsyncClient, redis_client: redis.Redis) -> None:
+    try:
+        # Only one worker refreshes a place at a time
+        if not await redis_client.set(f"{weather_key(place)}:refreshing", 1, nx=True,
+                                      ex=max(int(settings.WEATHER_UPSTREAM_TIMEOUT) + 1, 1)):
+            return
+        await refresh_weather(place, settings, client, redis_client)
+    except (CircuitOpen, asyncio.TimeoutError, httpx.HTTPError, redis.RedisError):
+        logger.warning("Background weather refresh for %s failed", place.key, exc_info=True)
+    finally:
+        _refreshing.discard(place.key)
+
+
+def schedule_refresh(place: Place, settings: Settings, client: httpx.AsyncClient, redis_client: redis.Redis) -> None:
+    if place.key in _refreshing:
+        return
+    _refreshing.add(place.key)
+    task = asyncio.create_task(_refresh_in_background(place, settings, client, redis_client))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def _serve_cached(place: Place, cached: Optional[dict], settings: Settings, client: httpx.AsyncClient,
+                  redis_client: redis.Redis) -> Optional[WeatherReading]:
+    """
+    The reading to serve without waiting for the upstream, if the cached one is
+    recent enough; a stale one is refreshed in the background.
+    """
+    if cached is None:
+        return None
+    age = max(int(time.time() - cached["t"]), 0)
+    if age < settings.WEATHER_FRESH_TTL:
+        return WeatherReading(cached["data"], "fresh", age)
+    if age < settings.WEATHER_STALE_TTL:
+        schedule_refresh(place, settings, client, redis_client)
+        return WeatherReading(cached["data"], "stale", age)
+    return None
+
+
+async def _fetch_or_fall_back(city_name: str, place: Place, cached: Optional[dict], settings: Settings,
+                              client: httpx.AsyncClient, redis_client: redis.Redis) -> WeatherReading:
+    try:
+        data = await refresh_weather(place, settings, client, redis_client)
+    except (CircuitOpen, asyncio.TimeoutError, httpx.HTTPError) as exc:
+        if cached is not None:
+            return WeatherReading(cached["data"], "fallback", max(int(time.time() - cached["t"]), 0))
+        raise WeatherUnavailable(f"Weather for '{city_name}' is unavailable right now.") from exc
+    return WeatherReading(data, "miss", 0)
+
+
+async def _read_cached(places: List[Place], redis_client: redis.Redis) -> List[Optional[dict]]:
+    # One round-trip: the readings, and a popularity bump for each place
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.mget([weather_key(place) for place in places])
+            for place in places:
+                pipe.zincrby(POPULARITY_KEY, 1, place.key)
+            raw, *_ = await pipe.execute()
+    except redis.RedisError:
+        logger.warning("Could not read the cached weather for %s", [place.key for place in places], exc_info=True)
+        return [None] * len(places)
+    return [json.loads(value) if value else None for value in raw]
+
+
+async def get_weather(city_name: str, settings: Settings, client: httpx.AsyncClient, redis_client: redis.Redis) -> WeatherReading:
+    """
+    Serves a fresh reading from Redis, or a stale one while refreshing it in the
+    background, and only waits for the upstream when there is neither. When the
+    upstream fails the last good reading is served, however old.
+    Raises UnknownCity for a name the gazetteer doesn't know, WeatherUnavailable
+    when there is nothing to serve.
+    """
+    place = resolve_city(city_name, settings)
+    [cached] = await _read_cached([place], redis_client)
+    reading = _serve_cached(place, cached, settings, client, redis_client)
+    if reading is not None:
+        return reading
+    return await _fetch_or_fall_back(city_name, place, cached, settings, client, redis_client)
+
+
+async def get_weather_batch(city_names: List[str], settings: Settings, client: httpx.AsyncClient,
+                            redis_client: redis.Redis) -> Dict[str, Union[WeatherReading, WeatherUnavailable]]:
+    """
+    get_weather for many cities at once: all cached readings come from a single
+    MGET, and the cities that need the upstream are fetched concurrently, at most
+    WEATHER_BATCH_CONCURRENCY at a time. Names that resolve to the same place are
+    looked up once. Maps each requested name to its reading, or to the
+    WeatherUnavailable (or UnknownCity) error for that city.
+    """
+    results: Dict[str, Union[WeatherReading, WeatherUnavailable]] = {}
+    places: Dict[str, Place] = {}
+    for name in city_names:
+        try:
+            places[name] = resolve_city(name, settings)
+        except UnknownCity as exc:
+            results[name] = exc
+    unique = list(dict.fromkeys(places.values()))
+    readings: Dict[Place, Union[WeatherReading, WeatherUnavailable]] = {}
+    missing = []
+    for place, cached in zip(unique, await _read_cached(unique, redis_client)):
+        reading = _serve_cached(place, cached, settings, client, redis_client)
+        if reading is None:
+            missing.append((place, cached))
+        else:
+            readings[place] = reading
+
+    semaphore = asyncio.Semaphore(WEATHER_BATCH_CONCURRENCY)
+    names = {place: name for name, place in places.items()}
+
+    async def fetch(place: Place, cached: Optional[dict]):
+        async with semaphore:
+            try:
+                readings[place] = await _fetch_or_fall_back(names[place], place, cached, settings, client, redis_client)
+            except WeatherUnavailable as exc:
+                readings[place] = exc
+            except Exception:
+                # One city failing unexpectedly must not cost the others their readings
+                logger.exception("Fetching the weather for %s failed", place.key)
+                readings[place] = WeatherUnavailable(f"Weather for '{names[place]}' is unavailable right now.")
+
+    await asyncio.gather(*[fetch(place, cached) for place, cached in missing])
+    results.update((name, readings[place]) for name, place in places.items())
+    return {name: results[name] for name in city_names}
+
+
+async def prewarm_weather(settings: Settings, client: httpx.AsyncClient, redis_client: redis.Redis) -> int:
+    """
+    Refreshes the most requested places whose reading is about to go stale, so
+    they are always served fresh. One worker per interval does it.
+    Returns how many places were refreshed.
+    """
+    if not await redis_client.set(PREWARM_LOCK_KEY, 1, nx=True, ex=settings.WEATHER_PREWARM_INTERVAL):
+        return 0
+    await redis_client.zremrangebyrank(POPULARITY_KEY, 0, -POPULARITY_KEEP - 1)
+    places = [Place.from_key(key.decode())
+              for key in await redis_client.zrevrange(POPULARITY_KEY, 0, settings.WEATHER_PREWARM_TOP - 1)]
+    if not places:
+        return 0
+    readings = await redis_client.mget([weather_key(place) for place in places])
+    # Anything that would go stale before the next round
+    refresh_before = time.time() - settings.WEATHER_FRESH_TTL + settings.WEATHER_PREWARM_INTERVAL
+    due = [place for place, raw in zip(places, readings) if raw is None or json.loads(raw)["t"] < refresh_before]
+    refreshed = 0
+    for place in due:
+        try:
+            await refresh_weather(place, settings, client, redis_client)
+            refreshed += 1
+        except CircuitOpen:
+            break
+        except (asyncio.TimeoutError, httpx.HTTPError):
+            logger.warning("Prewarming the weather for %s failed", place.key, exc_info=True)
+    return refreshed
+
 
+async def run_prewarmer(settings: Settings, redis_client: redis.Redis, client: httpx.AsyncClient) -> None:
+    # Started by main.lifespan, runs until the app stops
+    while True:
+        await asyncio.sleep(settings.WEATHER_PREWARM_INTERVAL)
+        try:
+            await prewarm_weather(settings, client, redis_client)
+        except redis.RedisError:
+            logger.warning("Weather prewarm round failed", exc_info=True)
@@ -24,6 +24,10 @@ const ProductApi = {
     // Includes authentication header to ensure only authenticated users can create products
     // Returns a promise that resolves when the product is successfully created
     createProduct: (productData) => api.post("/api/v1/products", productData, {headers: getAuthHeader()}),
+    // searchProducts method: server-side search over product names and descriptions
+    // Takes the search text and an optional cursor (next_cursor of the previous page)
+    // Returns a promise that resolves with { items, next_cursor }, best matches first
+    searchProducts: (query, cursor) => api.get("/api/v1/products/search", {params: {q: query, cursor}}),
 };
 
 // Export the ProductApi object so it can be imported and used in components
@@ -4,21 +4,63 @@ from api import user, product, category, review, basic_background, background_st
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
-from api import weather
+from api import weather, leaderboard, metrics
 
 from core.config import get_settings
 from contextlib import asynccontextmanager
 from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
 import redis.asyncio as redis
+import asyncio
+from core.auth import revocations, user_cache
+from core.cache import InstrumentedBackend, L1Backend, TaggedRedisBackend, request_key_builder
+from core.db import replicas
+from core.httpx_client import create_httpx_client
+from core.replicas import ReadYourWritesMiddleware
+from core.sql_metrics import SQLTimingMiddleware
+from external_services.weather import run_prewarmer
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Get settings and use REDIS_HOST from config
     settings = get_settings()
     redis_client = redis.Redis(host=settings.REDIS_HOST, port=6379, db=0)
-    FastAPICache.init(RedisBackend(redis_client), prefix="fastapi-cache")
+    cache_backend = TaggedRedisBackend(redis_client)
+    invalidation_listener = None
+    if settings.CACHE_L1_MAX_BYTES > 0:
+        cache_backend = L1Backend(cache_backend, redis_client,
+                                  max_bytes=settings.CACHE_L1_MAX_BYTES, ttl=settings.CACHE_L1_TTL)
+        invalidation_listener = asyncio.create_task(cache_backend.listen())
+    FastAPICache.init(
+        InstrumentedBackend(cache_backend),
+        prefix="fastapi-cache",
+        key_builder=request_key_builder,
+    )
+    app.state.redis = redis_client
+    user_cache.configure(redis_client, shared=settings.AUTH_USER_CACHE_REDIS)
+    user_invalidation_listener = asyncio.create_task(user_cache.listen())
+    revocations.configure(redis_client)
+    # Loaded before serving: until then the filter is empty and every revoked token passes
+    await revocations.reload()
+    revocation_listener = asyncio.create_task(revocations.listen())
+    httpx_client = create_httpx_client(settings)
+    app.state.httpx_client = httpx_client
+    weather_prewarmer = None
+    if settings.WEATHER_PREWARM_INTERVAL > 0:
+        weather_prewarmer = asyncio.create_task(run_prewarmer(settings, redis_client, httpx_client))
+    replica_monitor = None
+    if replicas.replicas:
+        replica_monitor = asyncio.create_task(replicas.monitor())
     yield
+    if replica_monitor is not None:
+        replica_monitor.cancel()
+        await replicas.dispose()
+    if invalidation_listener is not None:
+        invalidation_listener.cancel()
+    user_invalidation_listener.cancel()
+    revocation_listener.cancel()
+    if weather_prewarmer is not None:
+        weather_prewarmer.cancel()
+    await httpx_client.aclose()
     await redis_client.aclose() 
 
 # Create the main FastAPI application instance.
@@ -48,7 +90,9 @@ app.include_router(user.router, prefix="/api/v1/users", tags=["Users"])
 app.include_router(category.router, prefix="/api/v1/categories", tags=["Categories"])
 app.include_router(product.router, prefix="/api/v1/products", tags=["Products"])
 app.include_router(review.router, prefix="/api/v1/reviews", tags=["Reviews"])
+app.include_router(leaderboard.router, prefix="/api/v1/leaderboards", tags=["Leaderboards"])
 app.include_router(weather.router, prefix="/api/v1/weather", tags=["Weather"])
+app.include_router(metrics.router, prefix="/api/v1/metrics", tags=["Metrics"])
 app.include_router(basic_background.router, prefix="/api/v1/background", tags=["Background Tasks"])
 app.include_router(background_status.router, prefix="/api/v1/order_status", tags=["Order Status"])
 
@@ -58,6 +102,11 @@ origins = [
     "http://127.0.0.1:5173",
 ]
 
+if get_settings().DATABASE_REPLICA_URLS and get_settings().DB_READ_YOUR_WRITES_SECONDS > 0:
+    app.add_middleware(ReadYourWritesMiddleware, window=get_settings().DB_READ_YOUR_WRITES_SECONDS)
+
+app.add_middleware(SQLTimingMiddleware, n_plus_one_threshold=get_settings().SQL_N_PLUS_ONE_THRESHOLD)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -1,5 +1,8 @@
 from typing import List, Optional
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import DDL, Column, Index, event
 from sqlmodel import Field, Relationship, SQLModel
+from core.embeddings import EMBEDDING_DIM
 
 
 class User(SQLModel, table=True):
@@ -7,6 +10,8 @@ class User(SQLModel, table=True):
     username: str = Field(index=True, unique=True)
     password: str
     role: str = Field(default="customer")
+    # Goes into access tokens; bumped to revoke every token issued before (see core.auth)
+    token_version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
     reviews: List["Review"] = Relationship(back_populates="user")  # one user -> many reviews
 
 
@@ -17,16 +22,62 @@ class Category(SQLModel, table=True):
 
 
 class Product(SQLModel, table=True):
+    # (sort key, id) indexes back keyset pagination, see crud_product.get_products_keyset;
+    # (category_id, price) backs category + price range filtering
+    __table_args__ = (
+        Index("ix_product_name_id", "name", "id"),
+        Index("ix_product_price_id", "price", "id"),
+        Index("ix_product_category_id_price", "category_id", "price"),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(index=True)
     description: str
     price: float
     category_id: int = Field(foreign_key="category.id")
+    # Denormalized review aggregates, kept in step by crud_review.create_review
+    # and repairable with tasks.backfill_review_aggregates.
+    review_count: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_sum: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_1: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_2: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_3: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_4: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_5: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
     category: "Category" = Relationship(back_populates="products")  # many products -> one category
     reviews: List["Review"] = Relationship(back_populates="product")  # one product -> many reviews
 
+    @property
+    def average_rating(self) -> Optional[float]:
+        if not self.review_count:
+            return None
+        return round(self.rating_sum / self.review_count, 2)
+
+    @property
+    def rating_histogram(self) -> List[int]:
+        return [self.rating_1, self.rating_2, self.rating_3, self.rating_4, self.rating_5]
+
+
+# SQLite full-text index for crud_product.search_products. Migration e3b7c1f94a58
+# creates it on migrated databases; these create it for metadata.create_all ones.
+_PRODUCT_FTS_SQLITE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(name, description, content='product', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN "
+    "INSERT INTO product_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN "
+    "INSERT INTO product_fts(product_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name, description ON product BEGIN "
+    "INSERT INTO product_fts(product_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); "
+    "INSERT INTO product_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+)
+for _statement in _PRODUCT_FTS_SQLITE:
+    event.listen(Product.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+event.listen(Product.__table__, "before_drop",
+             DDL("DROP TABLE IF EXISTS product_fts").execute_if(dialect="sqlite"))
+
 
 class Review(SQLModel, table=True):
+    # Serves per-product review pages and "newest N reviews" lookups
+    __table_args__ = (Index("ix_review_product_id_id", "product_id", "id"),)
     id: Optional[int] = Field(default=None, primary_key=True)
     text: str
     rating: int
@@ -36,6 +87,14 @@ class Review(SQLModel, table=True):
     product: "Product" = Relationship(back_populates="reviews")  # many reviews -> one product
 
 
+class ProductEmbedding(SQLModel, table=True):
+    # Kept out of the product table so product reads don't carry the vector.
+    # Written by tasks.embed_products; HNSW-indexed on Postgres (pgvector).
+    __tablename__ = "product_embedding"
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+    embedding: List[float] = Field(sa_column=Column(Vector(EMBEDDING_DIM), nullable=False))
+
+
 class ProductOrder(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     customer_name: str
@@ -1,5 +1,5 @@
-from sqlmodel import SQLModel
-from typing import List, Optional
+from sqlmodel import Field, SQLModel
+from typing import Dict, List, Optional
 
 # User Schema...........................
 class UserBase(SQLModel):
@@ -12,6 +12,9 @@ class UserCreate(UserBase):
 class UserPublic(UserBase):
     id: int
 
+class UserRoleUpdate(SQLModel):
+    role: str
+
 # Category Schema........................
 class CategoryBase(SQLModel):
     name: str
@@ -28,6 +31,8 @@ class ReviewBase(SQLModel):
     rating: int
 
 class ReviewCreate(ReviewBase):
+    # Only new reviews are checked, so rows stored before the check keep serializing
+    rating: int = Field(ge=1, le=5)
     product_id: int
     # user_id is thken from the authenticated session of the user
 
@@ -35,6 +40,10 @@ class ReviewPublic(ReviewBase):
     id: int
     user: UserPublic
 
+class ReviewPage(SQLModel):
+    items: List[ReviewPublic]
+    next_cursor: Optional[str] = None
+
 # Product Schema...........................
 class ProductBase(SQLModel):
     name: str
@@ -47,7 +56,75 @@ class ProductCreate(ProductBase):
 class ProductPublic(ProductBase):
     id: int
     category: CategoryPublic
-    reviews: List[ReviewPublic]
+    reviews: List[ReviewPublic]  # the newest reviews only, see reviews_next
+    reviews_next: Optional[str] = None  # cursor for /api/v1/reviews/product/{id} when more reviews exist
+    review_count: int = 0
+    average_rating: Optional[float] = None
+    rating_histogram: List[int] = []  # counts of 1..5 star reviews
+
+class ProductPage(SQLModel):
+    items: List[ProductPublic]
+    next_cursor: Optional[str] = None
+
+# Facet counts returned next to a filtered product listing
+class CategoryFacet(SQLModel):
+    category_id: int
+    name: str
+    count: int
+
+class PriceBucketFacet(SQLModel):
+    min: float
+    max: Optional[float] = None  # None for the open-ended top bucket
+    count: int
+
+class ProductFacets(SQLModel):
+    categories: List[CategoryFacet]
+    price_buckets: List[PriceBucketFacet]
+
+class ProductFacetedList(SQLModel):
+    items: List[ProductPublic]
+    facets: ProductFacets
+
+# Bulk ingestion report: one entry per rejected input row (1-based)
+class BulkRowError(SQLModel):
+    row: int
+    errors: List[str]
+
+class BulkProductReport(SQLModel):
+    inserted: int
+    failed: int
+    errors: List[BulkRowError]
+    errors_truncated: bool = False
+
+# Listing view that carries the review aggregates instead of the reviews themselves
+class ProductSummary(ProductBase):
+    id: int
+    category: CategoryPublic
+    review_count: int = 0
+    average_rating: Optional[float] = None
+    rating_histogram: List[int] = []
+
+class SimilarProduct(ProductSummary):
+    score: float  # cosine similarity to the requested product, 1.0 is identical
+
+class LeaderboardEntry(SQLModel):
+    rank: int
+    score: float
+    product: ProductSummary
+
+class ProductSummaryPage(SQLModel):
+    items: List[ProductSummary]
+    next_cursor: Optional[str] = None
+
+class WeatherResult(SQLModel):
+    # fresh, stale, miss or fallback, as in the X-Weather-Cache header
+    status: str
+    age: int
+    data: dict
+
+class WeatherBatch(SQLModel):
+    results: Dict[str, WeatherResult]
+    errors: Dict[str, str]
 
 # To avoid circular imports, we can create specific models for nested data
 # that don't have their own nested relationships.
@@ -0,0 +1,93 @@
+"""
+Latency of a response cache lookup served by the in-process L1, by Redis (L2)
+and of a miss, and how long an invalidation takes to reach another worker.
+
+Usage:
+    python -m scripts.bench_cache --redis-url redis://localhost:6379/0 --size 20000 --repeat 2000
+
+The same key is looked up through L1Backend(TaggedRedisBackend) in each mode:
+"l1 hit" with the entry already in memory, "l2 hit" with the L1 emptied before
+every lookup, "miss" with the key absent from both. Then a second L1Backend on
+the same Redis plays another worker, and the time until a tag invalidation made
+by the first one has dropped its local copy is measured.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import redis.asyncio as redis
+from fastapi_cache import FastAPICache
+
+from core.cache import L1Backend, TaggedRedisBackend, _response_tags
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+async def timed(lookup, repeat: int, before=None):
+    samples = []
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        await lookup()
+        samples.append((time.perf_counter() - start) * 1_000_000)
+    return percentiles(samples)
+
+
+async def store(backend: L1Backend, key: str, value: bytes) -> None:
+    token = _response_tags.set(("bench",))
+    try:
+        await backend.set(key, value, expire=60)
+    finally:
+        _response_tags.reset(token)
+
+
+async def main(redis_url: str, size: int, repeat: int) -> None:
+    client = redis.Redis.from_url(redis_url)
+    FastAPICache.init(TaggedRedisBackend(client), prefix=f"bench-{uuid.uuid4().hex[:8]}")
+    worker_a = L1Backend(TaggedRedisBackend(client), client, max_bytes=64 * 1024 * 1024, ttl=30)
+    worker_b = L1Backend(TaggedRedisBackend(client), client, max_bytes=64 * 1024 * 1024, ttl=30)
+    listener = asyncio.create_task(worker_b.listen())
+    await asyncio.sleep(0.1)  # let the subscription start
+
+    prefix = FastAPICache.get_prefix()
+    key, absent = f"{prefix}:bench:hit", f"{prefix}:bench:absent"
+    value = b"x" * size
+    await store(worker_a, key, value)
+
+    results = {
+        "l1 hit": await timed(lambda: worker_a.get_with_ttl(key), repeat),
+        "l2 hit": await timed(lambda: worker_a.get_with_ttl(key), repeat, before=worker_a.clear_local),
+        "miss": await timed(lambda: worker_a.get_with_ttl(absent), repeat),
+    }
+
+    propagation = []
+    for _ in range(min(repeat, 200)):
+        await store(worker_b, key, value)
+        start = time.perf_counter()
+        await worker_a.invalidate_tags(["bench"])
+        while key in worker_b.entries:
+            await asyncio.sleep(0)
+        propagation.append((time.perf_counter() - start) * 1_000_000)
+    results["invalidation reaches other worker"] = percentiles(propagation)
+
+    listener.cancel()
+    await client.delete(key, worker_a.backend.tag_key("bench"))
+    await client.aclose()
+    print(f"value={size} bytes, {repeat} lookups per mode")
+    for name, (p50, p99) in results.items():
+        print(f"  {name:34}: p50 {p50:9.1f} us   p99 {p99:9.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    parser.add_argument("--size", type=int, default=20_000, help="Size of the cached value in bytes.")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.redis_url, args.size, args.repeat))
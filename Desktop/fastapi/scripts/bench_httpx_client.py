@@ -0,0 +1,103 @@
+"""
+Upstream call latency with a new httpx client per request (how the weather
+route used to work) vs the shared pooled client from core.httpx_client.
+
+Usage:
+    python -m scripts.bench_httpx_client --requests 1000 --concurrency 20
+    python -m scripts.bench_httpx_client --url https://api.open-meteo.com/v1/forecast?latitude=52.52&longitude=13.41&current_weather=true
+
+Without --url a local stub upstream is started in a separate process. Against
+a real HTTPS upstream the gap is much wider: every per-request client also pays
+for DNS and a TLS handshake.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from core.config import Settings
+from core.httpx_client import client_stats, create_httpx_client
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    body = json.dumps({"current_weather": {"temperature": 21.5, "windspeed": 9.0}}).encode()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_stub(port: int) -> None:
+    ThreadingHTTPServer(("127.0.0.1", port), StubHandler).serve_forever()
+
+
+async def measure(call, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await call()
+            response.raise_for_status()
+            samples.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(requests)])
+    elapsed = time.perf_counter() - start
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)], requests / elapsed
+
+
+async def main(url: str, requests: int, concurrency: int) -> None:
+    async def per_request_client():
+        async with httpx.AsyncClient() as client:
+            return await client.get(url)
+
+    # Defaults from core.config; the secrets Settings requires aren't needed here
+    shared = create_httpx_client(Settings.model_construct())
+
+    results = {
+        "client per request": await measure(per_request_client, requests, concurrency),
+        "shared pooled client": await measure(lambda: shared.get(url), requests, concurrency),
+    }
+    stats = client_stats(shared)
+    await shared.aclose()
+
+    print(f"{requests} requests, concurrency {concurrency}, {url}")
+    for name, (p50, p99, throughput) in results.items():
+        print(f"  {name:22}: p50 {p50:7.2f} ms   p99 {p99:7.2f} ms   {throughput:8.0f} req/s")
+    print(f"  shared pool afterwards: {stats}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="Upstream to call; a local stub is started when omitted.")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the local stub.")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    stub = None
+    url = args.url
+    if url is None:
+        stub = multiprocessing.Process(target=serve_stub, args=(args.port,), daemon=True)
+        stub.start()
+        time.sleep(0.5)
+        url = f"http://127.0.0.1:{args.port}/v1/forecast"
+    try:
+        asyncio.run(main(url, args.requests, args.concurrency))
+    finally:
+        if stub is not None:
+            stub.terminate()
@@ -0,0 +1,88 @@
+"""
+Latency of other requests during a login flood, with bcrypt hashed on the event
+loop (how login used to work) vs on core.security's bounded thread pool.
+
+Usage:
+    python -m scripts.bench_login_flood --logins 200 --concurrency 50
+
+Runs the app in-process against the configured DATABASE_URL (migrated). While
+`logins` logins run, `concurrency` at a time, GET / is requested every few
+milliseconds; its p50/p99/max is the latency any non-login request would see.
+With the pool, logins beyond its queue limit are answered 503 right away.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+import main
+from core.db import engine
+from core.security import hasher
+
+USERNAME = "bench-login-flood"
+PASSWORD = "bench-password"
+PROBE_INTERVAL = 0.005
+
+
+async def flood(client: httpx.AsyncClient, logins: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = []
+    probes = []
+    done = asyncio.Event()
+
+    async def login():
+        async with semaphore:
+            response = await client.post("/api/v1/users/token", data={"username": USERNAME, "password": PASSWORD})
+            statuses.append(response.status_code)
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            response = await client.get("/")
+            response.raise_for_status()
+            probes.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(PROBE_INTERVAL)
+
+    prober = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*[login() for _ in range(logins)])
+    elapsed = time.perf_counter() - start
+    done.set()
+    await prober
+    probes.sort()
+    return {
+        "probe_p50": probes[len(probes) // 2],
+        "probe_p99": probes[int(len(probes) * 0.99)],
+        "probe_max": probes[-1],
+        "ok": statuses.count(200),
+        "rejected": statuses.count(503),
+        "seconds": elapsed,
+    }
+
+
+async def run(logins: int, concurrency: int) -> None:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/api/v1/users/", json={"username": USERNAME, "password": PASSWORD})
+        if response.status_code not in (201, 409):
+            response.raise_for_status()
+        results = {}
+        for mode, enabled in (("on the event loop", False), ("bounded pool", True)):
+            hasher.enabled = enabled
+            results[mode] = await flood(client, logins, concurrency)
+    await engine.dispose()
+
+    print(f"{logins} logins, concurrency {concurrency}, pool of {hasher.workers} + {hasher.queue_limit} queued")
+    for mode, r in results.items():
+        print(f"  {mode:18}: GET / p50 {r['probe_p50']:8.2f} ms   p99 {r['probe_p99']:8.2f} ms   "
+              f"max {r['probe_max']:8.2f} ms   logins ok {r['ok']}, 503 {r['rejected']} in {r['seconds']:.2f} s")
+    print(f"  pool afterwards: {hasher.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.logins, args.concurrency))
@@ -0,0 +1,84 @@
+"""
+Compare page latency of OFFSET pagination vs keyset (cursor) pagination.
+
+Usage:
+    python -m scripts.bench_pagination --url sqlite+aiosqlite:///./bench.db --rows 100000 --page 1000
+
+The table is seeded once (products are only inserted if it is empty), then the
+same page is fetched in both modes and the median latency is printed.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import func, insert
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from core.pagination import encode_cursor
+from crud import crud_product
+from model.models import Category, Product
+
+
+async def seed(session: AsyncSession, rows: int) -> None:
+    count = (await session.exec(select(func.count()).select_from(Product))).one()
+    if count >= rows:
+        return
+    category = Category(name="bench")
+    session.add(category)
+    await session.flush()
+    batch = []
+    for i in range(count, rows):
+        batch.append({"name": f"product {i:07d}", "description": "benchmark item",
+                      "price": float(i % 997), "category_id": category.id})
+        if len(batch) == 5000:
+            await session.exec(insert(Product), params=batch)
+            batch = []
+    if batch:
+        await session.exec(insert(Product), params=batch)
+    await session.commit()
+
+
+async def timed(coro_factory, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await coro_factory()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+async def main(url: str, rows: int, page: int, limit: int, repeat: int) -> None:
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with factory() as session:
+        await seed(session, rows)
+        skip = (page - 1) * limit
+        # The cursor a client would hold after reading page - 1: the last row before `skip`.
+        last = (await session.exec(select(Product).order_by(Product.id).offset(skip - 1).limit(1))).one()
+        cursor = encode_cursor("id:asc", last.id, last.id)
+
+        offset_ms = await timed(lambda: crud_product.get_all_products_paginated(skip=skip, limit=limit, session=session), repeat)
+        cursor_ms = await timed(lambda: crud_product.get_products_keyset(session=session, limit=limit, cursor=cursor), repeat)
+
+    await engine.dispose()
+    print(f"rows={rows} page={page} limit={limit} (median of {repeat})")
+    print(f"  offset : {offset_ms:8.2f} ms")
+    print(f"  cursor : {cursor_ms:8.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="sqlite+aiosqlite:///./bench.db")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--page", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.rows, args.page, args.limit, args.repeat))
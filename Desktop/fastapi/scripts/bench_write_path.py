@@ -0,0 +1,159 @@
+"""
+Count database round-trips per create, before and after the INSERT ... RETURNING
+write path.
+
+Usage:
+    python -m scripts.bench_write_path --url sqlite+aiosqlite:///./bench_writes.db --repeat 200
+
+"legacy" replays the old pattern (add, commit, refresh, reload relationships)
+that the crud_* create functions used; "returning" calls the current crud
+functions and commits once, as the routers do. Every statement sent through the
+engine and every COMMIT counts as a round-trip.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+from sqlalchemy import event, update
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import selectinload, sessionmaker
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from crud import crud_category, crud_product, crud_review
+from model.models import Category, Product, Review, User
+from schema import CategoryCreate, ProductCreate, ReviewCreate
+
+
+class RoundTrips:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._statement)
+        event.listen(engine.sync_engine, "commit", self._commit)
+
+    def _statement(self, *args):
+        self.count += 1
+
+    def _commit(self, *args):
+        self.count += 1
+
+
+async def legacy_create_category(data: CategoryCreate, session: AsyncSession):
+    db_category = Category.model_validate(data)
+    session.add(db_category)
+    await session.commit()
+    await session.refresh(db_category)
+    return db_category
+
+
+async def legacy_create_product(data: ProductCreate, session: AsyncSession):
+    db_product = Product.model_validate(data)
+    session.add(db_product)
+    await session.commit()
+    await session.refresh(db_product)
+    statement = select(Product).where(Product.id == db_product.id).options(selectinload(Product.category))
+    product = (await session.exec(statement)).one()
+    set_committed_value(product, "reviews", [])
+    return product
+
+
+async def legacy_create_review(data: ReviewCreate, user_id: int, session: AsyncSession):
+    # the router used to load the product to check it exists
+    await session.exec(select(Product).where(Product.id == data.product_id)
+                       .options(selectinload(Product.category)))
+    db_review = Review.model_validate(data, update={"user_id": user_id})
+    session.add(db_review)
+    rating_column = f"rating_{db_review.rating}"
+    await session.exec(
+        update(Product)
+        .where(Product.id == db_review.product_id)
+        .values(
+            review_count=Product.review_count + 1,
+            rating_sum=Product.rating_sum + db_review.rating,
+            **{rating_column: getattr(Product, rating_column) + 1},
+        )
+    )
+    await session.commit()
+    await session.refresh(db_review, ["user"])
+    return db_review
+
+
+async def returning_create_category(data, session):
+    created = await crud_category.create_category(category_data=data, session=session)
+    await session.commit()
+    return created
+
+
+async def returning_create_product(data, session):
+    created = await crud_product.create_product(product_data=data, session=session)
+    await session.commit()
+    return created
+
+
+async def returning_create_review(data, user_id, session):
+    created = await crud_review.create_review(review_data=data, user_id=user_id, session=session)
+    await session.commit()
+    return created
+
+
+async def measure(factory, counter, repeat, make_call):
+    trips, samples = [], []
+    for i in range(repeat):
+        # a fresh session per create, like one request each
+        async with factory() as session:
+            before = counter.count
+            start = time.perf_counter()
+            await make_call(i, session)
+            samples.append((time.perf_counter() - start) * 1000)
+            trips.append(counter.count - before)
+    return statistics.mean(trips), statistics.median(samples)
+
+
+async def main(url: str, repeat: int) -> None:
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    run = uuid.uuid4().hex[:8]  # keeps unique names apart between runs on the same database
+    async with factory() as session:
+        user = User(username=f"bench {run}", password="x")
+        category = Category(name=f"bench {run}")
+        session.add_all([user, category])
+        await session.commit()
+        product = await crud_product.create_product(
+            ProductCreate(name="bench", description="d", price=1, category_id=category.id), session=session)
+        await session.commit()
+        user_id, category_id, product_id = user.id, category.id, product.id
+    counter = RoundTrips(engine)
+
+    cases = {
+        "category": (
+            lambda i, s: legacy_create_category(CategoryCreate(name=f"legacy {run} {i}"), s),
+            lambda i, s: returning_create_category(CategoryCreate(name=f"returning {run} {i}"), s),
+        ),
+        "product": (
+            lambda i, s: legacy_create_product(ProductCreate(name=f"p{i}", description="d", price=1, category_id=category_id), s),
+            lambda i, s: returning_create_product(ProductCreate(name=f"p{i}", description="d", price=1, category_id=category_id), s),
+        ),
+        "review": (
+            lambda i, s: legacy_create_review(ReviewCreate(text="t", rating=4, product_id=product_id), user_id, s),
+            lambda i, s: returning_create_review(ReviewCreate(text="t", rating=4, product_id=product_id), user_id, s),
+        ),
+    }
+    print(f"{'create':<10}{'legacy trips':>14}{'returning trips':>17}{'legacy ms':>12}{'returning ms':>14}")
+    for name, (legacy, returning) in cases.items():
+        legacy_trips, legacy_ms = await measure(factory, counter, repeat, legacy)
+        new_trips, new_ms = await measure(factory, counter, repeat, returning)
+        print(f"{name:<10}{legacy_trips:>14.1f}{new_trips:>17.1f}{legacy_ms:>12.2f}{new_ms:>14.2f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="sqlite+aiosqlite:///./bench_writes.db")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.repeat))
@@ -0,0 +1,57 @@
+"""
+Builds the offline gazetteer (see external_services.gazetteer) from a city list.
+
+Usage:
+    python -m scripts.build_gazetteer
+    python -m scripts.build_gazetteer --source my_cities.tsv --out data/cities
+
+The source is tab-separated: name, country code, latitude, longitude and
+|-separated aliases; lines starting with # are skipped. Every city is indexed
+under its name, its aliases, and both followed by the country code ("paris fr"),
+so "Paris, FR" resolves too. Point GAZETTEER_PATH at --out to use a custom index.
+"""
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+
+from external_services.gazetteer import BUNDLED_PATH, Gazetteer, build_index
+
+
+def read_entries(source: str):
+    with open(source, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+            if not row or row[0].startswith("#"):
+                continue
+            name, country, latitude, longitude, *rest = row
+            names = [name, *(alias for alias in (rest[0].split("|") if rest else []) if alias)]
+            for alias in names:
+                yield alias, float(latitude), float(longitude)
+            for alias in names:
+                yield f"{alias} {country}", float(latitude), float(longitude)
+
+
+def main(source: str, out: str) -> None:
+    names, coords, prefix = build_index(list(read_entries(source)))
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    np.save(f"{out}.names.npy", names)
+    np.save(f"{out}.coords.npy", coords)
+    np.save(f"{out}.prefix.npy", prefix)
+
+    gazetteer = Gazetteer.load(out)
+    lookups = [name.decode() for name in names[:: max(len(names) // 1000, 1)]]
+    start = time.perf_counter()
+    for name in lookups:
+        gazetteer.resolve(name)
+    per_lookup = (time.perf_counter() - start) / len(lookups) * 1e6
+    print(f"{len(names)} names -> {out}.*.npy, {per_lookup:.1f} µs per lookup")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", default=f"{BUNDLED_PATH}.tsv")
+    parser.add_argument("--out", default=BUNDLED_PATH)
+    args = parser.parse_args()
+    main(args.source, args.out)
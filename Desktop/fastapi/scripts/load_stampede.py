@@ -0,0 +1,80 @@
+"""
+Cache stampede load test: how many database queries a burst of identical
+requests causes right after its cache entry was dropped, with request
+coalescing off and on.
+
+Usage:
+    python -m scripts.load_stampede --redis-url redis://localhost:6379/0 --concurrency 200 --path /api/v1/categories/
+
+Runs the app in-process against the configured DATABASE_URL (migrated) and the
+given Redis. Each round drops the cached entry, fires `concurrency` identical
+GETs at once and counts the statements the engine executed meanwhile.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+import redis.asyncio as redis
+from fastapi_cache import FastAPICache
+from sqlalchemy import event
+
+import main
+from core.cache import InstrumentedBackend, TaggedRedisBackend, request_key_builder
+from core.db import engine
+from core.singleflight import flights
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._statement)
+
+    def _statement(self, *args):
+        self.count += 1
+
+
+async def stampede(client: httpx.AsyncClient, path: str, concurrency: int):
+    async def one():
+        start = time.perf_counter()
+        response = await client.get(path)
+        response.raise_for_status()
+        return (time.perf_counter() - start) * 1000
+
+    samples = sorted(await asyncio.gather(*[one() for _ in range(concurrency)]))
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+async def run(redis_url: str, path: str, concurrency: int, rounds: int) -> None:
+    engine.echo = False
+    redis_client = redis.Redis.from_url(redis_url)
+    main.app.state.redis = redis_client
+    FastAPICache.init(InstrumentedBackend(TaggedRedisBackend(redis_client)),
+                      prefix="stampede", key_builder=request_key_builder)
+    counter = QueryCounter()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for enabled in (False, True):
+            flights.enabled = enabled
+            queries, p50s, p99s = 0, [], []
+            for _ in range(rounds):
+                await FastAPICache.clear(namespace="")  # drop every entry under the prefix
+                before = counter.count
+                p50, p99 = await stampede(client, path, concurrency)
+                queries += counter.count - before
+                p50s.append(p50)
+                p99s.append(p99)
+            print(f"coalescing {'on ' if enabled else 'off'}: {queries / rounds:7.1f} queries per burst of "
+                  f"{concurrency}, p50 {sum(p50s) / rounds:7.1f} ms, p99 {sum(p99s) / rounds:7.1f} ms")
+    await redis_client.aclose()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    parser.add_argument("--path", default="/api/v1/categories/")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.redis_url, args.path, args.concurrency, args.rounds))
@@ -1,11 +1,22 @@
 import time
+import redis
 from worker import celery_app
 from core.config import settings
-from model.models import ProductOrder as Order
+from model.models import ProductOrder as Order, Product, ProductEmbedding, Review
 from sqlmodel import create_engine, select, Session
+from sqlalchemy import bindparam, case, func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from crud.crud_leaderboard import VERSIONS_KEY, board_scores, leaderboard_key
+from core.embeddings import create_embedding_matrix, get_embedder, product_document, publish_embedding_matrix
+from core.db_pool import engine_options
+from core.sql_metrics import instrument_engine, raise_on_lazy_loads
 
 # Create the engine once at the module level
-engine = create_engine(settings.DATABASE_SYNC_URL, echo=True)
+engine = create_engine(settings.DATABASE_SYNC_URL, echo=settings.SQL_ECHO,
+                       **engine_options(settings.DATABASE_SYNC_URL, settings, asynchronous=False))
+instrument_engine(engine)
+if settings.SQL_RAISE_ON_LAZY_LOAD:
+    raise_on_lazy_loads()
 
 STAGES = ["Packaging", "Shipping", "Delivered"]
 
@@ -43,4 +54,160 @@ def process_order(order_id: int):
             
             print(f"Order {order.id} status updated to: {order.status}")
     
-    return {"order_id": order.id, "final_status": order.status}
\ No newline at end of file
+    return {"order_id": order.id, "final_status": order.status}
+
+
+@celery_app.task
+def backfill_review_aggregates(chunk_size: int = 1000):
+    """
+    Recompute the denormalized review aggregates on Product from the review table.
+    Works through products in id order, one transaction per chunk_size products,
+    so it can run against a live database and be re-run to repair drift.
+    """
+    product_table = Product.__table__
+    write_stats = (
+        update(product_table)
+        .where(product_table.c.id == bindparam("pid"))
+        .values(
+            review_count=bindparam("count"),
+            rating_sum=bindparam("total"),
+            **{f"rating_{r}": bindparam(f"r{r}") for r in range(1, 6)},
+        )
+    )
+    last_id = 0
+    updated = 0
+    with Session(engine) as session:
+        while True:
+            # Lock the chunk so reviews created meanwhile wait for us and then
+            # apply their increment on top of the recomputed values.
+            ids = session.exec(
+                select(Product.id).where(Product.id > last_id).order_by(Product.id).limit(chunk_size).with_for_update()
+            ).all()
+            if not ids:
+                break
+            rows = session.exec(
+                select(
+                    Review.product_id,
+                    func.count(),
+                    func.sum(Review.rating),
+                    *[func.sum(case((Review.rating == r, 1), else_=0)) for r in range(1, 6)],
+                )
+                .where(Review.product_id.between(ids[0], ids[-1]))
+                .group_by(Review.product_id)
+            ).all()
+            stats = {row[0]: row[1:] for row in rows}
+            params = []
+            for pid in ids:
+                count, total, *histogram = stats.get(pid, (0, 0, 0, 0, 0, 0, 0))
+                params.append({"pid": pid, "count": count, "total": total,
+                               **{f"r{r}": histogram[r - 1] for r in range(1, 6)}})
+            session.execute(write_stats, params)
+            session.commit()
+            updated += len(ids)
+            last_id = ids[-1]
+            print(f"Review aggregates rebuilt up to product {last_id}")
+
+    return {"products_updated": updated}
+
+
+def _product_documents(session: Session, max_id: int, batch_size: int):
+    """Yields (ids, documents) chunks for products up to max_id, in id order."""
+    last_id = 0
+    while True:
+        rows = session.exec(
+            select(Product.id, Product.name, Product.description)
+            .where(Product.id > last_id, Product.id <= max_id)
+            .order_by(Product.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        yield [row[0] for row in rows], [product_document(row[1], row[2]) for row in rows]
+        last_id = rows[-1][0]
+
+
+@celery_app.task
+def embed_products(batch_size: int = 1000):
+    """
+    Rebuild the embeddings behind GET /api/v1/products/{id}/similar.
+    Fits the configured embedder on the whole catalog (first pass), then embeds it
+    chunk by chunk (second pass) into the pgvector product_embedding table on
+    Postgres, or into the memory-mapped NumPy matrix at EMBEDDINGS_PATH elsewhere.
+    """
+    embedder = get_embedder(settings.EMBEDDER)
+    use_pgvector = engine.dialect.name == "postgresql"
+    with Session(engine) as session:
+        # Pin the set of products so both passes see the same catalog
+        max_id = session.exec(select(func.max(Product.id))).one() or 0
+        total = session.exec(select(func.count()).select_from(Product).where(Product.id <= max_id)).one()
+        embedder.fit(document for _, documents in _product_documents(session, max_id, batch_size) for document in documents)
+
+        if use_pgvector:
+            upsert = pg_insert(ProductEmbedding.__table__)
+            upsert = upsert.on_conflict_do_update(index_elements=["product_id"], set_={"embedding": upsert.excluded.embedding})
+        else:
+            ids_out, matrix_out = create_embedding_matrix(settings.EMBEDDINGS_PATH, total)
+
+        written = 0
+        for ids, documents in _product_documents(session, max_id, batch_size):
+            if not ids:
+                continue
+            vectors = embedder.embed(documents)
+            if use_pgvector:
+                session.execute(upsert, [{"product_id": pid, "embedding": vector} for pid, vector in zip(ids, vectors)])
+                session.commit()
+            else:
+                ids_out[written:written + len(ids)] = ids
+                matrix_out[written:written + len(ids)] = vectors
+            written += len(ids)
+            print(f"Embedded {written}/{total} products")
+
+        if not use_pgvector:
+            # Rows deleted since the count leave the tail unfilled; publish what was embedded
+            publish_embedding_matrix(settings.EMBEDDINGS_PATH, ids_out, matrix_out, rows=written)
+
+    return {"products_embedded": written}
+
+
+@celery_app.task
+def rebuild_leaderboards(chunk_size: int = 1000):
+    """
+    Rebuild every leaderboard ZSET from the review aggregates on Product.
+    New boards are built under temporary keys and renamed over the live ones,
+    so readers never see a half-built board; boards left without products are removed.
+    """
+    redis_client = redis.Redis(host=settings.REDIS_HOST, port=6379, db=0)
+    leftovers = list(redis_client.scan_iter(match="rebuild:leaderboard:*"))  # from an interrupted run
+    if leftovers:
+        redis_client.delete(*leftovers)
+    live_keys = set(redis_client.scan_iter(match="leaderboard:*"))
+    built = set()
+    last_id = 0
+    with Session(engine) as session:
+        while True:
+            products = session.exec(
+                select(Product).where(Product.id > last_id, Product.review_count > 0).order_by(Product.id).limit(chunk_size)
+            ).all()
+            if not products:
+                break
+            pipe = redis_client.pipeline(transaction=False)
+            for product in products:
+                pipe.hset(f"rebuild:{VERSIONS_KEY}", product.id, product.review_count)
+                built.add(VERSIONS_KEY)
+                for board, score in board_scores(product.review_count, product.rating_sum).items():
+                    for key in (leaderboard_key(board), leaderboard_key(board, product.category_id)):
+                        pipe.zadd(f"rebuild:{key}", {product.id: score})
+                        built.add(key)
+            pipe.execute()
+            last_id = products[-1].id
+
+    pipe = redis_client.pipeline(transaction=True)
+    for key in built:
+        pipe.rename(f"rebuild:{key}", key)
+    stale = [key for key in live_keys if key.decode() not in built]
+    if stale:
+        pipe.delete(*stale)
+    pipe.execute()
+    redis_client.close()
+    return {"boards": len(built - {VERSIONS_KEY}), "removed": len(stale)}
+
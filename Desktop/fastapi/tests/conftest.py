@@ -0,0 +1,56 @@
+import asyncio
+import os
+import tempfile
+
+# Before anything imports core.config: a throwaway SQLite database, and the
+# settings .env would otherwise provide
+_database_dir = tempfile.mkdtemp(prefix="fastapi-tests-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_database_dir}/app.db"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("API_AUTH_KEY", "test-api-key")
+# Relationships the queries don't load eagerly raise, so an N+1 fails the tests
+os.environ["SQL_RAISE_ON_LAZY_LOAD"] = "true"
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+from fastapi_cache import FastAPICache
+from sqlalchemy import create_engine
+from sqlmodel import SQLModel
+
+import main
+from core import db
+from core.cache import InstrumentedBackend, TaggedRedisBackend, request_key_builder
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _dispose_engine():
+    yield
+    asyncio.run(db.engine.dispose())
+
+
+@pytest.fixture
+def database():
+    """An empty schema, built with metadata.create_all like a fresh local setup."""
+    engine = create_engine(db.settings.DATABASE_URL.replace("+aiosqlite", ""))
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.aioredis.FakeRedis()
+
+
+@pytest.fixture
+def client(database, redis_client):
+    """The app without its lifespan: fakeredis stands in for Redis."""
+    main.app.state.redis = redis_client
+    # init() is a no-op once initialized, which would keep the first test's Redis
+    FastAPICache.reset()
+    FastAPICache.init(InstrumentedBackend(TaggedRedisBackend(redis_client)), prefix="fastapi-cache",
+                      key_builder=request_key_builder)
+    return TestClient(main.app)
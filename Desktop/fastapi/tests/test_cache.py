@@ -0,0 +1,138 @@
+import asyncio
+from typing import List
+
+import httpx
+import pytest
+from fastapi_cache import FastAPICache
+
+import main
+from core.singleflight import SingleFlight, flights
+from core.sql_metrics import sql_metrics
+from crud import crud_category
+
+
+def test_second_identical_request_is_served_from_cache(client):
+    assert client.post("/api/v1/categories/", json={"name": "books"}).status_code == 201
+    stats = FastAPICache.get_backend().stats["get_allcategory_list"]
+
+    first = client.get("/api/v1/categories/")
+    queries = sql_metrics.queries
+    second = client.get("/api/v1/categories/")
+
+    assert first.headers["X-FastAPI-Cache"] == "MISS"
+    assert second.headers["X-FastAPI-Cache"] == "HIT"
+    assert second.json() == first.json() == [{"name": "books", "id": 1}]
+    assert (stats.hits, stats.misses) == (1, 1)
+    assert sql_metrics.queries == queries
+    assert "Server-Timing" not in second.headers
+
+
+def test_query_string_is_part_of_the_key(client):
+    other = client.get("/api/v1/categories/", params={"unused": "1"})
+    again = client.get("/api/v1/categories/", params={"unused": "1"})
+
+    assert other.headers["X-FastAPI-Cache"] == "MISS"
+    assert again.headers["X-FastAPI-Cache"] == "HIT"
+    assert client.get("/api/v1/categories/", params={"unused": "2"}).headers["X-FastAPI-Cache"] == "MISS"
+
+
+@pytest.fixture
+def counted_categories(monkeypatch):
+    """Counts runs of the category listing's query, slowed down so concurrent requests overlap."""
+    runs = []
+    get_all_category = crud_category.get_all_category
+
+    async def slow_get_all_category(session):
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return await get_all_category(session=session)
+
+    monkeypatch.setattr(crud_category, "get_all_category", slow_get_all_category)
+    return runs
+
+
+async def _get_concurrently(path: str, n: int) -> List[httpx.Response]:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        return await asyncio.gather(*[client.get(path) for _ in range(n)])
+
+
+def test_concurrent_identical_misses_run_the_endpoint_once(client, counted_categories):
+    client.post("/api/v1/categories/", json={"name": "books"})
+
+    responses = asyncio.run(_get_concurrently("/api/v1/categories/", 10))
+
+    assert len(counted_categories) == 1
+    assert {response.status_code for response in responses} == {200}
+    assert all(response.json() == [{"name": "books", "id": 1}] for response in responses)
+
+
+def test_followers_get_the_leaders_exception():
+    flight = SingleFlight()
+    runs = []
+
+    async def failing():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream broke")
+
+    async def run():
+        return await asyncio.gather(*[flight.do("key", failing) for _ in range(3)], return_exceptions=True)
+
+    outcomes = asyncio.run(run())
+    assert len(runs) == 1
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    assert (flight.leaders, flight.followers, flight.calls) == (1, 2, {})
+
+
+def test_a_follower_takes_over_when_the_leader_is_cancelled():
+    flight = SingleFlight()
+    runs = []
+
+    async def compute():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return len(runs)
+
+    async def run():
+        leader = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0.01)
+        # As when the leader's client disconnects
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    # The follower ran it again itself, so its result isn't shared
+    assert asyncio.run(run()) == (2, False)
+    assert flight.leaders == 2
+
+
+def test_a_miss_waits_for_the_worker_holding_the_lock_and_serves_its_entry(client, redis_client,
+                                                                           counted_categories):
+    client.post("/api/v1/categories/", json={"name": "books"})
+    expected = client.get("/api/v1/categories/").json()
+    [key] = asyncio.run(redis_client.keys("fastapi-cache:get_allcategory_list:*"))
+    entry = asyncio.run(redis_client.get(key))
+    asyncio.run(redis_client.delete(key))
+    peer_waits = flights.peer_waits
+
+    async def run():
+        # Another worker missed first, holds the lock and is computing the entry
+        lock = redis_client.lock(f"{key.decode()}:lock", timeout=5)
+        assert await lock.acquire(blocking=False)
+
+        async def other_worker():
+            await asyncio.sleep(0.1)
+            await redis_client.set(key, entry)
+            await lock.release()
+
+        [response], _ = await asyncio.gather(_get_concurrently("/api/v1/categories/", 1), other_worker())
+        return response
+
+    response = asyncio.run(run())
+    assert response.json() == expected
+    # Only the first request above ran the query
+    assert len(counted_categories) == 1
+    assert flights.peer_waits == peer_waits + 1
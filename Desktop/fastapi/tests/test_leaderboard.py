@@ -0,0 +1,34 @@
+import asyncio
+
+from crud.crud_leaderboard import VERSIONS_KEY, get_leaderboard, leaderboard_key, record_product
+from model.models import Product
+
+
+def _product(review_count: int, rating_sum: int) -> Product:
+    return Product(id=7, name="p", description="d", price=1, category_id=3,
+                   review_count=review_count, rating_sum=rating_sum)
+
+
+def test_record_product_writes_global_and_category_boards(redis_client):
+    async def run():
+        assert await record_product(redis_client, _product(review_count=2, rating_sum=10))
+        return (await get_leaderboard(redis_client, "most_reviewed"),
+                await get_leaderboard(redis_client, "most_reviewed", category_id=3))
+
+    assert asyncio.run(run()) == ([(7, 2.0)], [(7, 2.0)])
+
+
+def test_record_product_ignores_an_older_snapshot_arriving_late(redis_client):
+    async def run():
+        # The second review's update lands first, then the first review's
+        await record_product(redis_client, _product(review_count=2, rating_sum=6))
+        late = await record_product(redis_client, _product(review_count=1, rating_sum=5))
+        scores = {board: await redis_client.zscore(leaderboard_key(board), 7)
+                  for board in ("most_reviewed", "top_rated")}
+        return late, scores, await redis_client.hget(VERSIONS_KEY, 7)
+
+    late, scores, version = asyncio.run(run())
+    assert not late
+    assert scores["most_reviewed"] == 2.0
+    assert scores["top_rated"] == (3.0 * 5 + 6) / (5 + 2)
+    assert version == b"2"
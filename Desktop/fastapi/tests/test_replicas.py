@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlmodel import SQLModel
+
+import api.product
+from core import db
+from core.config import Settings
+from core.replicas import ReplicaSet, read_session_factory
+
+
+@pytest.fixture
+def lagging_replica(database, tmp_path, monkeypatch):
+    # A second SQLite database with the schema but none of the primary's rows
+    url = f"sqlite:///{tmp_path}/replica.db"
+    engine = create_engine(url)
+    SQLModel.metadata.create_all(engine)
+    engine.dispose()
+    replicas = ReplicaSet(Settings(DATABASE_REPLICA_URLS=url.replace("sqlite", "sqlite+aiosqlite", 1)),
+                          primary=read_session_factory(db.engine))
+    monkeypatch.setattr(db, "replicas", replicas)
+    monkeypatch.setattr(api.product, "replicas", replicas)
+    yield replicas
+    asyncio.run(replicas.dispose())
+
+
+def test_cached_routes_are_filled_from_the_primary(client, lagging_replica):
+    category = client.post("/api/v1/categories/", json={"name": "books"}).json()
+
+    # An uncached read goes to the replica, which hasn't seen the write yet
+    assert client.get(f"/api/v1/categories/{category['id']}").status_code == 404
+    # A cached one would keep serving the replica's view to everyone until the next write
+    first = client.get("/api/v1/categories/")
+    second = client.get("/api/v1/categories/")
+
+    assert first.json() == second.json() == [category]
+    assert second.headers["X-FastAPI-Cache"] == "HIT"
+    stats = lagging_replica.stats()
+    assert stats["replicas"][0]["sessions"] == 1
+    assert stats["cache_fill_reads"] == 2
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import api.metrics
+from core import security
+from core.auth import create_access_token
+from core.security import PasswordHasher
+
+ADMIN = {"Authorization": f"Bearer {create_access_token({'sub': 'admin', 'role': 'admin'})}"}
+LOGIN = {"username": "sam", "password": "secret"}
+
+
+@pytest.fixture
+def hasher(monkeypatch):
+    # One thread, nothing may queue behind it
+    hasher = PasswordHasher(workers=1, queue_limit=0)
+    monkeypatch.setattr(security, "hasher", hasher)
+    monkeypatch.setattr(api.metrics, "hasher", hasher)
+    yield hasher
+    hasher.executor.shutdown()
+
+
+@pytest.fixture
+def shopper(client, hasher):
+    assert client.post("/api/v1/users/", json=LOGIN).status_code == 201
+
+
+def _occupy(hasher: PasswordHasher) -> threading.Event:
+    """Keeps the hasher's only thread busy, from another event loop, until the returned event is set."""
+    release = threading.Event()
+    thread = threading.Thread(target=asyncio.run, args=(hasher.run(release.wait),), daemon=True)
+    thread.start()
+    while hasher.pending < 1:
+        time.sleep(0.001)
+    return release
+
+
+def test_login_is_refused_with_503_while_the_hasher_is_full(client, hasher, shopper):
+    release = _occupy(hasher)
+    try:
+        response = client.post("/api/v1/users/token", data=LOGIN)
+        stats = client.get("/api/v1/metrics/password-hasher", headers=ADMIN).json()
+    finally:
+        release.set()
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert (stats["running"], stats["queued"], stats["rejected"]) == (1, 0, 1)
+
+
+def test_hashes_cancelled_in_the_queue_give_their_slots_back(client, hasher, shopper):
+    hasher.queue_limit = 2
+
+    async def cancel_queued():
+        release = threading.Event()
+        running = asyncio.create_task(hasher.run(release.wait))
+        queued = [asyncio.create_task(hasher.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        # As when the clients disconnect while their hashes wait for the thread
+        for task in queued:
+            task.cancel()
+        await asyncio.gather(*queued, return_exceptions=True)
+        release.set()
+        await running
+        await asyncio.sleep(0.05)
+
+    asyncio.run(cancel_queued())
+
+    assert hasher.pending == 0
+    assert client.post("/api/v1/users/token", data=LOGIN).status_code == 200
+    assert hasher.stats()["running"] == 0
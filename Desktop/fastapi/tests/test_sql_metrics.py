@@ -0,0 +1,45 @@
+import asyncio
+import logging
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import exc, text
+from sqlmodel import select
+
+from core import db
+from core.sql_metrics import SQLTimingMiddleware, sql_metrics
+from model.models import Category, Product
+
+
+def test_an_unloaded_relationship_raises_instead_of_querying(database):
+    async def run():
+        async with db.AsyncSessionFactory() as session:
+            session.add(Product(name="lamp", description="d", price=1, category=Category(name="home")))
+            await session.commit()
+        async with db.AsyncSessionFactory() as session:
+            product = (await session.exec(select(Product))).one()
+            with pytest.raises(exc.InvalidRequestError, match="raise_on_sql"):
+                product.reviews
+
+    asyncio.run(run())
+
+
+def test_a_repeated_statement_is_reported_as_n_plus_one(database, caplog):
+    app = FastAPI()
+
+    @app.get("/lamps")
+    async def lamps():
+        async with db.AsyncSessionFactory() as session:
+            for product_id in range(3):
+                await session.exec(text("SELECT name FROM product WHERE id = :id").bindparams(id=product_id))
+        return {}
+
+    app.add_middleware(SQLTimingMiddleware, n_plus_one_threshold=3)
+    with caplog.at_level(logging.WARNING, logger="core.sql_metrics"):
+        response = TestClient(app).get("/lamps")
+
+    assert response.headers["Server-Timing"].startswith("db;dur=")
+    assert 'desc="3 queries"' in response.headers["Server-Timing"]
+    assert "Possible N+1 on GET /lamps: the same statement ran 3 times" in caplog.text
+    assert sql_metrics.snapshot()["routes"]["GET /lamps"]["n_plus_one"] == 1
@@ -0,0 +1,89 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+import redis.asyncio as redis
+
+from core.auth import create_access_token, revocations, user_cache
+from core.revocation import REVOKED_KEY, version_entry
+from core.sql_metrics import sql_metrics
+
+ADMIN = {"Authorization": f"Bearer {create_access_token({'sub': 'admin', 'role': 'admin'})}"}
+
+
+@pytest.fixture
+def shopper(client, redis_client, monkeypatch):
+    monkeypatch.setattr(revocations, "redis", redis_client)
+    response = client.post("/api/v1/users/", json={"username": "sam", "password": "secret"})
+    assert response.status_code == 201
+    return response.json()
+
+
+def test_role_change_revokes_the_tokens_carrying_the_old_role(client, redis_client, shopper):
+    response = client.patch(f"/api/v1/users/{shopper['id']}/role", json={"role": "admin"}, headers=ADMIN)
+
+    assert response.status_code == 200
+    assert response.json()["role"] == "admin"
+    assert asyncio.run(redis_client.zscore(REVOKED_KEY, version_entry("sam", 0))) is not None
+
+
+def test_role_is_not_changed_when_the_tokens_cannot_be_revoked(client, redis_client, shopper, monkeypatch):
+    async def unreachable(*args, **kwargs):
+        raise redis.ConnectionError("Redis is down")
+
+    monkeypatch.setattr(redis_client, "publish", unreachable)
+    response = client.patch(f"/api/v1/users/{shopper['id']}/role", json={"role": "admin"}, headers=ADMIN)
+
+    assert response.status_code == 503
+    assert client.get(f"/api/v1/users/{shopper['id']}").json()["role"] == "customer"
+    # The half-made revocation is taken back, so tokens of the unchanged version still work
+    assert asyncio.run(redis_client.zscore(REVOKED_KEY, version_entry("sam", 0))) is None
+
+
+@pytest.fixture
+def shared_user_cache(redis_client, monkeypatch):
+    monkeypatch.setattr(user_cache, "redis", redis_client)
+    monkeypatch.setattr(user_cache, "shared", True)
+    monkeypatch.setattr(user_cache, "entries", OrderedDict())
+    monkeypatch.setattr(user_cache, "hits", 0)
+    return user_cache
+
+
+def _as(username: str, role: str = "customer", version: int = 0) -> dict:
+    return {"Authorization": f"Bearer {create_access_token({'sub': username, 'role': role, 'ver': version})}"}
+
+
+def test_a_cached_user_is_resolved_without_a_query(client, shopper, shared_user_cache):
+    assert client.get("/api/v1/users/my_session/", headers=_as("sam")).status_code == 200
+    queries = sql_metrics.queries
+    response = client.get("/api/v1/users/my_session/", headers=_as("sam"))
+
+    assert response.json()["username"] == "sam"
+    assert sql_metrics.queries == queries
+    assert "Server-Timing" not in response.headers
+    assert shared_user_cache.hits == 1
+
+
+def test_role_change_drops_the_cached_user(client, redis_client, shopper, shared_user_cache):
+    assert client.get("/api/v1/users/my_session/", headers=_as("sam")).json()["role"] == "customer"
+    assert asyncio.run(redis_client.exists(user_cache.redis_key("sam")))
+
+    client.patch(f"/api/v1/users/{shopper['id']}/role", json={"role": "admin"}, headers=ADMIN)
+
+    assert "sam" not in shared_user_cache.entries
+    assert not asyncio.run(redis_client.exists(user_cache.redis_key("sam")))
+    # A token issued after the change, as a new login would get
+    response = client.get("/api/v1/users/my_session/", headers=_as("sam", "admin", version=1))
+    assert response.json()["role"] == "admin"
+
+
+def test_a_zero_ttl_turns_the_cache_off(client, shopper, shared_user_cache, monkeypatch):
+    monkeypatch.setattr(user_cache, "ttl", 0)
+    client.get("/api/v1/users/my_session/", headers=_as("sam"))
+    queries = sql_metrics.queries
+    response = client.get("/api/v1/users/my_session/", headers=_as("sam"))
+
+    assert response.status_code == 200
+    assert sql_metrics.queries > queries
+    assert not shared_user_cache.entries
+    assert shared_user_cache.hits == 0
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from core.circuit_breaker import CircuitBreaker
+from core.config import Settings
+from external_services import weather
+
+FORECAST = {"current_weather": {"temperature": 21.5, "windspeed": 9.0}}
+
+
+class StubUpstream:
+    """A local stand-in for open-meteo answering with the queued (status, body) pairs."""
+
+    def __init__(self):
+        self.answers = []
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                status, body = stub.answers.pop(0) if len(stub.answers) > 1 else stub.answers[0]
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1/forecast"
+
+    def answer(self, status: int, body: bytes = json.dumps(FORECAST).encode()) -> None:
+        self.answers.append((status, body))
+
+
+@pytest.fixture
+def upstream():
+    stub = StubUpstream()
+    thread = threading.Thread(target=stub.server.serve_forever, daemon=True)
+    thread.start()
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    monkeypatch.setattr(weather, "breaker", breaker)
+    return breaker
+
+
+def _settings(upstream: StubUpstream) -> Settings:
+    # Nothing is fresh or stale, so every request goes to the upstream
+    return Settings(WEATHER_BASE_URL=upstream.url, WEATHER_FRESH_TTL=0, WEATHER_STALE_TTL=0,
+                    WEATHER_UPSTREAM_TIMEOUT=2)
+
+
+def _half_open(breaker: CircuitBreaker) -> None:
+    breaker.opened_at -= breaker.reset_timeout
+
+
+def test_last_good_reading_is_served_while_the_circuit_is_open(upstream, breaker, redis_client):
+    settings = _settings(upstream)
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            get = lambda: weather.get_weather("berlin", settings, client, redis_client)
+            upstream.answer(200)
+            statuses = [(await get()).status]
+            upstream.answers[:] = [(503, b"down")]
+            statuses += [(await get()).status for _ in range(3)]
+            states = [breaker.state, upstream.requests]
+            _half_open(breaker)
+            upstream.answers[:] = [(200, json.dumps(FORECAST).encode())]
+            reading = await get()
+            return statuses, states, reading
+
+    statuses, states, reading = asyncio.run(run())
+    assert statuses == ["miss", "fallback", "fallback", "fallback"]
+    # The third failing call never reached the upstream
+    assert states == ["open", 3]
+    assert reading == weather.WeatherReading(FORECAST, "miss", 0)
+    assert breaker.state == "closed"
+
+
+def test_a_trial_answered_with_a_body_that_isnt_json_reopens_the_circuit(upstream, breaker, redis_client):
+    settings = _settings(upstream)
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            get = lambda: weather.get_weather("berlin", settings, client, redis_client)
+            upstream.answer(500, b"down")
+            for _ in range(2):
+                with pytest.raises(weather.WeatherUnavailable):
+                    await get()
+            _half_open(breaker)
+            upstream.answers[:] = [(200, b"<html>maintenance</html>")]
+            with pytest.raises(weather.WeatherUnavailable):
+                await get()
+            reopened = (breaker.state, breaker.trial_running)
+            _half_open(breaker)
+            upstream.answers[:] = [(200, json.dumps(FORECAST).encode())]
+            return reopened, await get()
+
+    reopened, reading = asyncio.run(run())
+    assert reopened == ("open", False)
+    assert reading.status == "miss"
+    assert breaker.state == "closed"
+
+
+def test_a_cancelled_trial_lets_the_next_one_through(upstream, breaker, redis_client):
+    settings = _settings(upstream)
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout
+    breaker.failures = breaker.failure_threshold
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            upstream.answer(200)
+            trial = asyncio.create_task(weather.refresh_weather(
+                weather.resolve_city("berlin", settings), settings, client, redis_client))
+            await asyncio.sleep(0)
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+            return breaker.state, breaker.allow()
+
+    assert asyncio.run(run()) == ("half-open", True)
+
+
+def test_a_city_failing_unexpectedly_is_reported_without_failing_the_batch(upstream, breaker, redis_client,
+                                                                          monkeypatch):
+    settings = _settings(upstream)
+    fetch_or_fall_back = weather._fetch_or_fall_back
+
+    async def broken_for_paris(city_name, *args):
+        if city_name == "paris":
+            raise KeyError("current_weather")
+        return await fetch_or_fall_back(city_name, *args)
+
+    monkeypatch.setattr(weather, "_fetch_or_fall_back", broken_for_paris)
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            upstream.answer(200)
+            return await weather.get_weather_batch(["berlin", "paris", "atlantis"], settings, client, redis_client)
+
+    readings = asyncio.run(run())
+    assert readings["berlin"].status == "miss"
+    assert isinstance(readings["paris"], weather.WeatherUnavailable)
+    assert isinstance(readings["atlantis"], weather.UnknownCity)